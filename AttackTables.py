@@ -0,0 +1,166 @@
+"""
+Attack tables built once at import time so move generation never does bounds arithmetic.
+
+Squares use the Bitboards numbering (row * 8 + col). Every table comes in two forms: target squares as (row, col)
+tuples for the list backend and bitboard masks for the bitboard backend.
+"""
+
+import Bitboards
+
+
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (2, -1), (2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+# (row step, col step) per ray. Rays going to a higher square index come first in each tuple.
+ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+
+
+def onBoard(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+def buildTargets(offsets):
+    targets = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        targets.append(tuple((row + dr, col + dc) for dr, dc in offsets if onBoard(row + dr, col + dc)))
+    return targets
+
+
+"""One tuple of squares per direction, nearest square first"""
+
+
+def buildRays(directions):
+    rays = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        squareRays = []
+        for dr, dc in directions:
+            ray = []
+            r, c = row + dr, col + dc
+            while onBoard(r, c):
+                ray.append((r, c))
+                r += dr
+                c += dc
+            squareRays.append(tuple(ray))
+        rays.append(tuple(squareRays))
+    return rays
+
+
+def toMask(squares):
+    mask = 0
+    for row, col in squares:
+        mask |= Bitboards.squareBit(row, col)
+    return mask
+
+
+# list backend tables, indexed by square
+KNIGHT_TARGETS = buildTargets(KNIGHT_OFFSETS)
+KING_TARGETS = buildTargets(KING_OFFSETS)
+ROOK_RAYS = buildRays(ROOK_DIRECTIONS)
+BISHOP_RAYS = buildRays(BISHOP_DIRECTIONS)
+
+# bitboard backend tables, indexed by square
+KNIGHT_ATTACKS = [toMask(targets) for targets in KNIGHT_TARGETS]
+KING_ATTACKS = [toMask(targets) for targets in KING_TARGETS]
+
+# RAY_MASKS[direction][square], directions 0-1 of each piece increase the square index and 2-3 decrease it
+ROOK_RAY_MASKS = [[toMask(ROOK_RAYS[square][direction]) for square in range(64)] for direction in range(4)]
+BISHOP_RAY_MASKS = [[toMask(BISHOP_RAYS[square][direction]) for square in range(64)] for direction in range(4)]
+
+
+"""
+Attacks along the rays of one slider for a given occupancy. Each ray is cut at its first blocker by removing the
+blocker's own ray in the same direction, the nearest blocker is the lowest set bit on increasing rays and the
+highest on decreasing ones.
+"""
+
+
+def rayAttacks(square, occupied, rayMasks):
+    attacks = 0
+    for direction in range(4):
+        masks = rayMasks[direction]
+        ray = masks[square]
+        blockers = ray & occupied
+        if blockers:
+            if direction < 2:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= masks[first]
+        attacks |= ray
+    return attacks
+
+
+def rookAttacks(square, occupied):
+    return rayAttacks(square, occupied, ROOK_RAY_MASKS)
+
+
+def bishopAttacks(square, occupied):
+    return rayAttacks(square, occupied, BISHOP_RAY_MASKS)
+
+
+def queenAttacks(square, occupied):
+    return rayAttacks(square, occupied, ROOK_RAY_MASKS) | rayAttacks(square, occupied, BISHOP_RAY_MASKS)
+
+
+def buildPawnAttacks(rowStep):
+    return [toMask(targets) for targets in buildTargets(((rowStep, -1), (rowStep, 1)))]
+
+
+# PAWN_ATTACKS[Bitboards.WHITE][square] are the squares a white pawn on square attacks
+PAWN_ATTACKS = [buildPawnAttacks(-1), buildPawnAttacks(1)]
+
+
+"""BETWEEN[a][b] holds the squares strictly between a and b when they share a rank, file or diagonal, else 0"""
+
+
+def buildBetween():
+    between = [[0] * 64 for _ in range(64)]
+    for square in range(64):
+        for ray in ROOK_RAYS[square] + BISHOP_RAYS[square]:
+            mask = 0
+            for row, col in ray:
+                between[square][row * 8 + col] = mask
+                mask |= Bitboards.squareBit(row, col)
+    return between
+
+
+BETWEEN = buildBetween()
+
+
+"""Every square attacked by one side, pass Bitboards.WHITE or Bitboards.BLACK as color"""
+
+
+def attackedBy(bitboards, color, occupied):
+    offset = 6 * color
+    pawns = bitboards[offset]
+    if color == Bitboards.WHITE:
+        attacks = Bitboards.northWest(pawns) | Bitboards.northEast(pawns)
+    else:
+        attacks = Bitboards.southWest(pawns) | Bitboards.southEast(pawns)
+
+    for square in Bitboards.iterSquares(bitboards[offset + 1]):
+        attacks |= KNIGHT_ATTACKS[square]
+    for square in Bitboards.iterSquares(bitboards[offset + 2] | bitboards[offset + 4]):
+        attacks |= rayAttacks(square, occupied, BISHOP_RAY_MASKS)
+    for square in Bitboards.iterSquares(bitboards[offset + 3] | bitboards[offset + 4]):
+        attacks |= rayAttacks(square, occupied, ROOK_RAY_MASKS)
+    for square in Bitboards.iterSquares(bitboards[offset + 5]):
+        attacks |= KING_ATTACKS[square]
+    return attacks
+
+
+"""Squares holding a piece of color that attacks square"""
+
+
+def attackersOf(square, bitboards, color, occupied):
+    offset = 6 * color
+    diagonal = bitboards[offset + 2] | bitboards[offset + 4]
+    straight = bitboards[offset + 3] | bitboards[offset + 4]
+    return ((PAWN_ATTACKS[1 - color][square] & bitboards[offset])
+            | (KNIGHT_ATTACKS[square] & bitboards[offset + 1])
+            | (KING_ATTACKS[square] & bitboards[offset + 5])
+            | (rayAttacks(square, occupied, BISHOP_RAY_MASKS) & diagonal)
+            | (rayAttacks(square, occupied, ROOK_RAY_MASKS) & straight))
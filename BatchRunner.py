@@ -0,0 +1,154 @@
+"""
+Runs move generation, perft or evaluation over a stream of FEN lines with a pool of worker processes.
+
+The input is read a chunk at a time and only a few chunks per worker are in flight at once, so files of millions of
+positions stream through in constant memory. Every input line gives one output line, the FEN and the result
+separated by a tab. Ordered output keeps the input order, unordered writes chunks as soon as they finish. Progress
+and throughput go to stderr.
+
+    python BatchRunner.py moves positions.fen --output moves.txt
+    python BatchRunner.py perft --depth 3 --workers 8 --unordered < positions.fen
+    python BatchRunner.py eval positions.fen --chunk-size 5000
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import os
+import sys
+import time
+
+import ChessEngine
+import Evaluation
+import Perft
+
+
+# chunks waiting or running per worker, enough to keep every worker busy while the main process writes
+CHUNKS_PER_WORKER = 2
+
+
+def analyseFEN(fen, command, depth, backend):
+    gs = ChessEngine.GameState.fromFEN(fen, backend)
+    if command == "moves":
+        moves = gs.getValidMoves()
+        return " ".join([str(len(moves))] + [move.getChessNotation() for move in moves])
+    if command == "perft":
+        return str(Perft.perft(gs, depth))
+    return str(Evaluation.evaluate(gs))
+
+
+"""Runs in a worker: returns the output lines for a chunk of input lines, bad FENs get an error instead of a result"""
+
+
+def processChunk(lines, command, depth, backend):
+    output = []
+    for line in lines:
+        fen = line.strip()
+        try:
+            result = analyseFEN(fen, command, depth, backend)
+        except (ValueError, KeyError, IndexError) as error:
+            result = "error: " + str(error)
+        output.append(fen + "\t" + result + "\n")
+    return output
+
+
+"""Chunks of non empty, non comment lines, read lazily"""
+
+
+def readChunks(file, chunkSize):
+    lines = (line for line in file if line.strip() and not line.startswith("#"))
+    while True:
+        chunk = list(itertools.islice(lines, chunkSize))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Progress():
+    def __init__(self, interval, stream=sys.stderr):
+        self.interval = interval
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.lastReport = self.start
+        self.positions = 0
+
+    def add(self, positions):
+        self.positions += positions
+        now = time.perf_counter()
+        if self.interval and now - self.lastReport >= self.interval:
+            self.lastReport = now
+            self.report(now)
+
+    def report(self, now):
+        seconds = now - self.start
+        self.stream.write("%d positions %.1fs %d positions per second\n"
+                          % (self.positions, seconds, self.positions / seconds if seconds > 0 else 0))
+        self.stream.flush()
+
+
+"""
+Streams the lines of source through the pool and writes the results to output. Returns the number of positions.
+"""
+
+
+def runBatch(source, output, command, depth=1, backend="list", workers=None, chunkSize=1000, ordered=True,
+             progressInterval=5.0):
+    workers = workers or os.cpu_count() or 1
+    progress = Progress(progressInterval)
+    chunks = readChunks(source, chunkSize)
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        # in submission order, so ordered mode can wait for the oldest chunk
+        inFlight = collections.deque()
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                inFlight.append(pool.submit(processChunk, chunk, command, depth, backend))
+                if len(inFlight) < workers * CHUNKS_PER_WORKER:
+                    continue
+
+            # input is used up once chunk is None, then everything left gets written
+            while inFlight and (chunk is None or len(inFlight) >= workers * CHUNKS_PER_WORKER):
+                if ordered:
+                    done = inFlight.popleft()
+                else:
+                    finished, _ = concurrent.futures.wait(inFlight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    done = finished.pop()
+                    inFlight.remove(done)
+                lines = done.result()
+                output.writelines(lines)
+                progress.add(len(lines))
+
+    output.flush()
+    if progressInterval:
+        progress.report(time.perf_counter())
+    return progress.positions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move generation, perft or evaluation over a file of FEN lines")
+    parser.add_argument("command", choices=("moves", "perft", "eval"),
+                        help="moves: legal move count and moves, perft: node count, eval: score for the side to move")
+    parser.add_argument("input", nargs="?", default="-", help="file with one FEN per line, - for stdin")
+    parser.add_argument("--output", default="-", help="file to write the results to, - for stdout")
+    parser.add_argument("--depth", type=int, default=1, help="perft depth")
+    parser.add_argument("--backend", choices=ChessEngine.BACKENDS, default="list")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per core by default")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="positions sent to a worker at a time")
+    parser.add_argument("--unordered", action="store_true",
+                        help="write results as they finish instead of in input order")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between progress lines, 0 for none")
+    # intermixed so the input file may come after the options
+    args = parser.parse_intermixed_args(argv)
+
+    with contextlib.ExitStack() as stack:
+        source = sys.stdin if args.input == "-" else stack.enter_context(open(args.input))
+        output = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w"))
+        runBatch(source, output, args.command, args.depth, args.backend, args.workers, args.chunk_size,
+                 not args.unordered, args.progress)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
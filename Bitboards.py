@@ -0,0 +1,90 @@
+"""
+Helpers for the bitboard backend of GameState.
+
+A bitboard is a 64 bit integer with one bit per square. Squares are numbered row * 8 + col, the same
+layout as GameState.board, so square 0 is a8 (top left) and square 63 is h1 (bottom right).
+"""
+
+
+PIECES = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+
+# indexes into GameState.occupancy
+WHITE = 0
+BLACK = 1
+BOTH = 2
+
+FULL = (1 << 64) - 1
+
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+
+# ROWS[0] is rank 8, ROWS[7] is rank 1
+ROWS = [0xFF << (8 * row) for row in range(8)]
+
+
+def squareBit(row, col):
+    return 1 << (row * 8 + col)
+
+
+"""Yields the square index of every set bit, lowest first"""
+
+
+def iterSquares(bitboard):
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+"""Builds the twelve piece bitboards from a list of lists board"""
+
+
+def boardToBitboards(board):
+    bitboards = [0] * len(PIECES)
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece != "--":
+                bitboards[PIECE_INDEX[piece]] |= squareBit(row, col)
+    return bitboards
+
+
+"""Returns [white, black, both] occupancy boards for a set of piece bitboards"""
+
+
+def occupancyOf(bitboards):
+    white = 0
+    black = 0
+    for index in range(6):
+        white |= bitboards[index]
+        black |= bitboards[index + 6]
+    return [white, black, white | black]
+
+
+# One step shifts. North is towards row 0 (rank 8), east is towards col 7 (the h file).
+
+def north(bitboard):
+    return bitboard >> 8
+
+
+def south(bitboard):
+    return (bitboard << 8) & FULL
+
+
+def northEast(bitboard):
+    return (bitboard >> 7) & NOT_FILE_A
+
+
+def northWest(bitboard):
+    return (bitboard >> 9) & NOT_FILE_H
+
+
+def southEast(bitboard):
+    return (bitboard << 9) & NOT_FILE_A & FULL
+
+
+def southWest(bitboard):
+    return (bitboard << 7) & NOT_FILE_H & FULL
@@ -3,12 +3,60 @@ This class is responsible for storing information about the current state of a c
 Also responsible for determining the valid moves at the current state. It will also keep a move log.
 """
 
+import array
+import struct
+
+import AttackTables
+import Bitboards
+import Evaluation
+import Zobrist
+
 
 BLANK_SPACE = "--"
 
+# king destination col -> (rook start col, rook end col)
+CASTLE_ROOK_COLS = {6: (7, 5), 2: (0, 3)}
+
+PROMOTION_PIECES = ("Q", "R", "B", "N")
+
+# move code layout, see Move
+CODE_PROMOTION_PIECES = ("N", "B", "R", "Q")
+CODE_KIND_MASK = 3 << 14
+CODE_PROMOTION = 1 << 14
+CODE_ENPASSANT = 2 << 14
+CODE_CASTLE = 3 << 14
+# no legal chess position has more than 218 moves
+MAX_MOVES = 256
+
+# what generateMoveCodes generates
+GENERATE_ALL = 0
+GENERATE_CAPTURES = 1
+GENERATE_QUIETS = 2
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+FEN_PIECES = {"p": "p", "n": "N", "b": "B", "r": "R", "q": "Q", "k": "K"}
+
+# Packed positions: 64 four bit piece codes (two squares per byte, lower square in the low nibble), a flag byte
+# (bit 0 white to move, bits 1-4 castling KQkq), the en passant square or 255, halfmove clock and fullmove number
+PACKED_FORMAT = struct.Struct("<32sBBHH")
+PACKED_SIZE = PACKED_FORMAT.size
+PACKED_PIECES = [BLANK_SPACE] + Bitboards.PIECES
+PACKED_PIECE_CODES = {piece: code for code, piece in enumerate(PACKED_PIECES)}
+# a piece's code is the code of its color plus the code of its type, so toPacked can translate the two letters apart
+PACKED_COLOR_TABLE = bytes.maketrans(b"wb-", bytes([0, 6, 0]))
+PACKED_TYPE_TABLE = bytes.maketrans(b"pNBRQK-", bytes([1, 2, 3, 4, 5, 6, 0]))
+NO_ENPASSANT = 255
+
+# "list" walks the 8x8 board of strings, "bitboard" generates moves from one 64 bit integer per piece
+BACKENDS = ("list", "bitboard")
+
 
 class GameState():
-    def __init__(self):
+    def __init__(self, backend="list"):
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend " + repr(backend) + ", expected one of " + str(BACKENDS))
+
         self.board = [
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
             ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
@@ -26,7 +74,159 @@ class GameState():
         self.whiteCanCastleQueen = True
         self.moveLog = []
 
+        # square a pawn skipped with a two square move on the last turn, as (row, col), else None
+        self.enpassantPossible = None
+        # plies since the last capture or pawn move, for the 50 move rule
+        self.halfmoveClock = 0
+        self.fullmoveNumber = 1
+
+        # one entry per move in moveLog with the state makeMove can't recompute backwards: captured piece, castling
+        # flags, en passant square, move counters, evaluation score and Zobrist key
+        self.undoStack = []
+
+        # board is always kept up to date so main.drawGameState can read it, the bitboards only exist for that backend
+        self.backend = backend
+        self.bitboards = None
+        self.occupancy = None
+        # getValidMoves' scratch space for move codes
+        self.moveBuffer = newMoveBuffer()
+        self.zobrist = 0
+        # material and piece-square score from white's point of view, see Evaluation
+        self.evalScore = 0
+        self.resetDerivedState()
+
+    """Builds a GameState from a FEN string"""
+
+    @classmethod
+    def fromFEN(cls, fen, backend="list"):
+        gs = cls(backend)
+        gs.loadFEN(fen)
+        return gs
+
+    """Replaces the position with the one described by a FEN string and clears the move log"""
+
+    def loadFEN(self, fen):
+        fields = fen.split()
+        if len(fields) not in (4, 6):
+            raise ValueError("FEN needs 4 or 6 fields: " + repr(fen))
+
+        board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend([BLANK_SPACE] * int(char))
+                elif char.lower() in FEN_PIECES:
+                    row.append(("w" if char.isupper() else "b") + FEN_PIECES[char.lower()])
+                else:
+                    raise ValueError("Unknown piece " + repr(char) + " in FEN: " + repr(fen))
+            board.append(row)
+        if len(board) != 8 or any(len(row) != 8 for row in board):
+            raise ValueError("FEN placement is not 8x8: " + repr(fen))
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + repr(fen))
+        # the square a pawn of the side not to move just skipped over
+        enpassantRank = "6" if fields[1] == "w" else "3"
+        if fields[3] != "-" and (len(fields[3]) != 2 or fields[3][0] not in "abcdefgh" or
+                                 fields[3][1] != enpassantRank):
+            raise ValueError("FEN en passant square must be - or on rank " + enpassantRank + ": " + repr(fen))
+
+        self.board = board
+        self.whiteToMove = fields[1] == "w"
+        self.whiteCanCastleKing = "K" in fields[2]
+        self.whiteCanCastleQueen = "Q" in fields[2]
+        self.blackCanCastleKing = "k" in fields[2]
+        self.blackCanCastleQueen = "q" in fields[2]
+        if fields[3] == "-":
+            self.enpassantPossible = None
+        else:
+            self.enpassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        self.halfmoveClock = int(fields[4]) if len(fields) == 6 else 0
+        self.fullmoveNumber = int(fields[5]) if len(fields) == 6 else 1
+
+        self.moveLog = []
+        self.undoStack = []
+        self.resetDerivedState()
+
+    def toFEN(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == BLANK_SPACE:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == "w" else piece[1].lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        castling = ("K" * self.whiteCanCastleKing + "Q" * self.whiteCanCastleQueen +
+                    "k" * self.blackCanCastleKing + "q" * self.blackCanCastleQueen) or "-"
+        enpassant = "-"
+        if self.enpassantPossible is not None:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+
+        return " ".join(["/".join(ranks), "w" if self.whiteToMove else "b", castling, enpassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)])
+
+    """Fixed size binary encoding of the position, PACKED_SIZE bytes long. The move log is not included."""
+
+    def toPacked(self):
+        # one byte per square as an int, bytes are below 16 so the codes add without carries and the odd squares
+        # shift into the high nibble of the even ones
+        text = "".join(map("".join, self.board)).encode()
+        codes = (int.from_bytes(text[0::2].translate(PACKED_COLOR_TABLE), "little") +
+                 int.from_bytes(text[1::2].translate(PACKED_TYPE_TABLE), "little"))
+        squares = (codes | codes >> 4).to_bytes(64, "little")[0::2]
+        flags = (self.whiteToMove | self.whiteCanCastleKing << 1 | self.whiteCanCastleQueen << 2 |
+                 self.blackCanCastleKing << 3 | self.blackCanCastleQueen << 4)
+        enpassant = NO_ENPASSANT
+        if self.enpassantPossible is not None:
+            enpassant = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+        return PACKED_FORMAT.pack(squares, flags, enpassant, min(self.halfmoveClock, 0xFFFF), self.fullmoveNumber)
+
+    @classmethod
+    def fromPacked(cls, data, backend="list"):
+        squares, flags, enpassant, halfmoveClock, fullmoveNumber = PACKED_FORMAT.unpack(data)
+        gs = cls(backend)
+        gs.board = [[PACKED_PIECES[(squares[(row * 8 + col) >> 1] >> (4 * (col & 1))) & 0xF] for col in range(8)]
+                    for row in range(8)]
+        gs.whiteToMove = bool(flags & 1)
+        gs.whiteCanCastleKing = bool(flags & 2)
+        gs.whiteCanCastleQueen = bool(flags & 4)
+        gs.blackCanCastleKing = bool(flags & 8)
+        gs.blackCanCastleQueen = bool(flags & 16)
+        gs.enpassantPossible = None if enpassant == NO_ENPASSANT else divmod(enpassant, 8)
+        gs.halfmoveClock = halfmoveClock
+        gs.fullmoveNumber = fullmoveNumber
+        gs.resetDerivedState()
+        return gs
+
+    """Rebuilds the bitboards, the Zobrist key and the evaluation score from scratch after the position was replaced"""
+
+    def resetDerivedState(self):
+        if self.backend == "bitboard":
+            self.bitboards = Bitboards.boardToBitboards(self.board)
+            self.occupancy = Bitboards.occupancyOf(self.bitboards)
+        self.zobrist = Zobrist.hashPosition(self)
+        self.evalScore = Evaluation.evaluatePosition(self)
+
+    """64 bit Zobrist key of the position, the same key a Polyglot opening book uses"""
+
+    @property
+    def zobristKey(self):
+        return self.zobrist
+
     def makeMove(self, move):
+        # the old castling and en passant keys come out now, the new ones go in once the move is on the board
+        zobrist = self.zobrist ^ Zobrist.moveKey(move) ^ Zobrist.enpassantKey(self) ^ \
+            Zobrist.CASTLING_KEYS[Zobrist.castlingRights(self)]
+
         self.board[move.startRow][move.startCol] = BLANK_SPACE
         self.board[move.endRow][move.endCol] = move.pieceMoved
 
@@ -35,104 +235,410 @@ class GameState():
             assert move.startRow != move.endRow
             assert move.startCol != move.endCol
 
-            print("makeMove: removing the captured pawn")
-            self.board[move.startRow][move.endCol] = BLANK_SPACE # TODO this line is not working
+            self.board[move.startRow][move.endCol] = BLANK_SPACE
 
+        if move.pawnPromotion:
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
 
-        # Castling rights adjustment -- This code is very messy should look for alternatives
-        if move.pieceMoved[1] == 'K':
-            if self.whiteToMove:
-                self.whiteCanCastleQueen = False
-                self.whiteCanCastleKing = False
-            else:
-                self.blackCanCastleKing = False
-                self.blackCanCastleQueen = False
+        # the king has already moved two squares, bring the rook over to the other side of it
+        if move.castle:
+            rookFrom, rookTo = CASTLE_ROOK_COLS[move.endCol]
+            self.board[move.endRow][rookTo] = self.board[move.endRow][rookFrom]
+            self.board[move.endRow][rookFrom] = BLANK_SPACE
 
-        if move.pieceMoved[1] == 'R':
-            if self.whiteToMove:
-                if self.whiteCanCastleKing and move.startRow == 7 and move.startCol == 7:
-                    self.whiteCanCastleKing = False
-                if self.whiteCanCastleQueen and move.startRow == 7 and move.startCol == 0:
-                    self.whiteCanCastleQueen = False
-            else:
-                if self.blackCanCastleKing and move.startRow == 0 and move.startCol == 7:
-                    self.blackCanCastleKing = False
-                if self.blackCanCastleQueen and move.startRow == 0 and move.startCol == 0:
-                    self.blackCanCastleQueen = False
+        if self.bitboards is not None:
+            self.toggleBitboards(move)
 
-        if move.pieceCaptured[1] == 'R':
-            if self.whiteToMove:
-                if self.whiteCanCastleKing and move.endRow == 7 and move.endCol == 7:
-                    self.whiteCanCastleKing = False
-                if self.whiteCanCastleQueen and move.endRow == 7 and move.endCol == 0:
-                    self.whiteCanCastleQueen = False
-            else:
-                if self.blackCanCastleKing and move.endRow == 0 and move.endCol == 7:
-                    self.blackCanCastleKing = False
-                if self.blackCanCastleQueen and move.endRow == 0 and move.endCol == 0:
-                    self.blackCanCastleQueen = False
+        # everything the move destroys, so undoMove can put it back exactly without replaying anything
+        self.undoStack.append((move.pieceCaptured, self.whiteCanCastleKing, self.whiteCanCastleQueen,
+                               self.blackCanCastleKing, self.blackCanCastleQueen, self.enpassantPossible,
+                               self.halfmoveClock, self.fullmoveNumber, self.evalScore, self.zobrist))
+        self.evalScore += Evaluation.moveDelta(move)
+
+        if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
+            self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
+        else:
+            self.enpassantPossible = None
+
+        if move.pieceMoved[1] == 'p' or move.pieceCaptured != BLANK_SPACE:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+
+        # Castling rights are lost once anything moves from or to the king's or the rook's starting square
+        touched = ((move.startRow, move.startCol), (move.endRow, move.endCol))
+        if (7, 4) in touched or (7, 7) in touched:
+            self.whiteCanCastleKing = False
+        if (7, 4) in touched or (7, 0) in touched:
+            self.whiteCanCastleQueen = False
+        if (0, 4) in touched or (0, 7) in touched:
+            self.blackCanCastleKing = False
+        if (0, 4) in touched or (0, 0) in touched:
+            self.blackCanCastleQueen = False
 
         self.moveLog.append(move)  # log move
         self.whiteToMove = not self.whiteToMove  # next turn
 
+        self.zobrist = zobrist ^ Zobrist.CASTLING_KEYS[Zobrist.castlingRights(self)] ^ Zobrist.enpassantKey(self) ^ \
+            Zobrist.WHITE_TO_MOVE_KEY
+
     def undoMove(self):
         if len(self.moveLog) == 0:
             return
 
-        move = self.moveLog[-1]
+        move = self.moveLog.pop()
+        (captured, self.whiteCanCastleKing, self.whiteCanCastleQueen, self.blackCanCastleKing,
+         self.blackCanCastleQueen, self.enpassantPossible, self.halfmoveClock, self.fullmoveNumber, self.evalScore,
+         self.zobrist) = self.undoStack.pop()
 
+        self.board[move.startRow][move.startCol] = move.pieceMoved
         if move.enpassant:
             self.board[move.endRow][move.endCol] = BLANK_SPACE
-            self.board[move.startRow][move.endCol] = move.pieceCaptured
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.whiteToMove = not self.whiteToMove
+            self.board[move.startRow][move.endCol] = captured
+        else:
+            self.board[move.endRow][move.endCol] = captured
 
+        if move.castle:
+            rookFrom, rookTo = CASTLE_ROOK_COLS[move.endCol]
+            self.board[move.endRow][rookFrom] = self.board[move.endRow][rookTo]
+            self.board[move.endRow][rookTo] = BLANK_SPACE
+
+        if self.bitboards is not None:
+            self.toggleBitboards(move)
+
+        self.whiteToMove = not self.whiteToMove
+
+    """
+    Flips the bits a move changes. Applying it twice restores the bitboards, so makeMove and undoMove share it
+    """
+
+    def toggleBitboards(self, move):
+        fromBit = Bitboards.squareBit(move.startRow, move.startCol)
+        toBit = Bitboards.squareBit(move.endRow, move.endCol)
+        moverColor = Bitboards.WHITE if move.pieceMoved[0] == 'w' else Bitboards.BLACK
+
+        if move.pawnPromotion:
+            self.bitboards[Bitboards.PIECE_INDEX[move.pieceMoved]] ^= fromBit
+            self.bitboards[Bitboards.PIECE_INDEX[move.pieceMoved[0] + move.promotionChoice]] ^= toBit
         else:
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.whiteToMove = not self.whiteToMove
+            self.bitboards[Bitboards.PIECE_INDEX[move.pieceMoved]] ^= fromBit | toBit
+        self.occupancy[moverColor] ^= fromBit | toBit
+
+        if move.pieceCaptured != BLANK_SPACE:
+            if move.enpassant:
+                captureBit = Bitboards.squareBit(move.startRow, move.endCol)
+            else:
+                captureBit = toBit
+            self.bitboards[Bitboards.PIECE_INDEX[move.pieceCaptured]] ^= captureBit
+            self.occupancy[1 - moverColor] ^= captureBit
 
-        self.moveLog.pop()
+        if move.castle:
+            rookFrom, rookTo = CASTLE_ROOK_COLS[move.endCol]
+            rookBits = Bitboards.squareBit(move.endRow, rookFrom) | Bitboards.squareBit(move.endRow, rookTo)
+            self.bitboards[Bitboards.PIECE_INDEX[move.pieceMoved[0] + 'R']] ^= rookBits
+            self.occupancy[moverColor] ^= rookBits
+
+        self.occupancy[Bitboards.BOTH] = self.occupancy[Bitboards.WHITE] | self.occupancy[Bitboards.BLACK]
 
     """
     gets valid moves considering checks
+
+    Checkers, pins and the squares the opponent attacks are worked out once for the position, then every pseudo-legal
+    move is filtered against them. Nothing is played on the board. The bitboard backend generates legal move codes
+    straight away and only builds the Moves at the end.
     """
 
     def getValidMoves(self):
+        if self.bitboards is not None:
+            count = self.generateMoveCodes(self.moveBuffer)
+            board = self.board
+            return [Move.fromCode(code, board) for code in self.moveBuffer[:count]]
+        return self.filterLegalMoves(self.getAllPossibleMoves())
+
+    """The moves out of the pseudo-legal moves that don't leave the king in check"""
+
+    def filterLegalMoves(self, moves):
+        bitboards, occupancy = self.getPositionBitboards()
+        kingSquare, attacked, checkers, checkMask, pins = self.getLegalityInfo(bitboards, occupancy)
+        if kingSquare < 0:
+            return moves
+
         validMoves = []
-        possibleMoves = self.getAllPossibleMoves()
+        for move in moves:
+            fromSquare = move.startRow * 8 + move.startCol
+            toBit = Bitboards.squareBit(move.endRow, move.endCol)
+
+            if fromSquare == kingSquare:
+                if move.castle:
+                    # the king may not castle out of check, and neither the square it crosses nor lands on may be attacked
+                    crossedBit = Bitboards.squareBit(move.startRow, (move.startCol + move.endCol) // 2)
+                    if not checkers and not attacked & (crossedBit | toBit):
+                        validMoves.append(move)
+                elif not attacked & toBit:
+                    validMoves.append(move)
+            elif move.enpassant:
+                if self.enpassantIsLegal(fromSquare, move.endRow * 8 + move.endCol, kingSquare, bitboards, occupancy):
+                    validMoves.append(move)
+            elif toBit & checkMask and (fromSquare not in pins or toBit & pins[fromSquare]):
+                validMoves.append(move)
 
-        for x in possibleMoves:
-            self.makeMove(x)
-            responses = self.getAllPossibleMoves(validate=True)
+        return validMoves
 
-            valid = True
-            for i in responses:
-                # print(i.getChessNotation())
-                if i.pieceCaptured[1] == 'K':
-                    valid = False
+    """
+    Works out what restricts the moves of the side to move. Returns (king square, squares the opponent attacks,
+    pieces giving check, squares a non king move has to land on, pins). The king square is -1 when there is no king.
+    """
 
-            if valid:
-                # print("Adding", x.getChessNotation())
-                validMoves.append(x)
-            else:
-                # print("Rejected", x.getChessNotation())
-                pass
+    def getLegalityInfo(self, bitboards, occupancy):
+        color = Bitboards.WHITE if self.whiteToMove else Bitboards.BLACK
+        kingBitboard = bitboards[6 * color + 5]
+        if not kingBitboard:
+            return -1, 0, 0, Bitboards.FULL, {}
+
+        kingSquare = kingBitboard.bit_length() - 1
+        occupied = occupancy[Bitboards.BOTH]
+
+        # the king is lifted off the board so it can't step back along the ray of a slider that is checking it
+        attacked = AttackTables.attackedBy(bitboards, 1 - color, occupied ^ kingBitboard)
+        checkers = AttackTables.attackersOf(kingSquare, bitboards, 1 - color, occupied)
+        pins = self.getPins(kingSquare, bitboards, occupancy, color)
+
+        if checkers & (checkers - 1):
+            # double check, only the king can move
+            checkMask = 0
+        elif checkers:
+            checkMask = checkers | AttackTables.BETWEEN[kingSquare][checkers.bit_length() - 1]
+        else:
+            checkMask = Bitboards.FULL
 
-            self.undoMove()
+        return kingSquare, attacked, checkers, checkMask, pins
 
-        validMoves.append(9)
-        return validMoves
+    """
+    Legal move generation without Move objects. Writes packed move codes (see Move.code) into a preallocated buffer
+    such as one from newMoveBuffer and returns how many were written.
+    kind picks all moves, only captures and promotions (GENERATE_CAPTURES) or only the rest (GENERATE_QUIETS), so
+    a search can look at captures first and skip generating quiet moves when a capture already refutes the position.
+    """
+
+    def generateMoveCodes(self, buffer, kind=GENERATE_ALL):
+        bitboards, occupancy = self.getPositionBitboards()
+        kingSquare, attacked, checkers, checkMask, pins = self.getLegalityInfo(bitboards, occupancy)
+        color = Bitboards.WHITE if self.whiteToMove else Bitboards.BLACK
+        offset = 6 * color
+        occupied = occupancy[Bitboards.BOTH]
+        enemy = occupancy[1 - color]
+        lastRow = 0 if self.whiteToMove else 7
+        count = 0
+
+        # squares pieces may land on, pawns also count promotions as captures
+        if kind == GENERATE_CAPTURES:
+            notOwn = enemy
+            pawnMask = enemy | Bitboards.ROWS[lastRow]
+        elif kind == GENERATE_QUIETS:
+            notOwn = Bitboards.FULL ^ occupied
+            pawnMask = Bitboards.FULL ^ (enemy | Bitboards.ROWS[lastRow])
+        else:
+            notOwn = Bitboards.FULL ^ occupancy[color]
+            pawnMask = Bitboards.FULL
+
+        if kingSquare >= 0:
+            count = self.generateKingCodes(kingSquare, attacked, notOwn, buffer, count)
+            if not checkers and kind != GENERATE_CAPTURES:
+                count = self.generateCastleCodes(kingSquare, attacked, bitboards[offset + 3], occupied, buffer, count)
+            if not checkMask:
+                return count
+
+        count = self.generateKnightCodes(bitboards[offset + 1], notOwn & checkMask, pins, buffer, count)
+        count = self.generateSliderCodes(bitboards[offset + 2] | bitboards[offset + 4],
+                                         bitboards[offset + 3] | bitboards[offset + 4], occupied,
+                                         notOwn & checkMask, pins, buffer, count)
+        count = self.generatePawnCodes(bitboards[offset], occupied, enemy, pawnMask & checkMask, pins, buffer, count)
+        if self.enpassantPossible is not None and kind != GENERATE_QUIETS:
+            count = self.generateEnpassantCodes(kingSquare, bitboards, occupancy, buffer, count)
+        return count
+
+    def generateKingCodes(self, kingSquare, attacked, notOwn, buffer, count):
+        for target in Bitboards.iterSquares(AttackTables.KING_ATTACKS[kingSquare] & notOwn & ~attacked):
+            buffer[count] = kingSquare | target << 6
+            count += 1
+        return count
+
+    """targets holds the squares knights may land on, a pinned knight can never stay on its pin line"""
+
+    def generateKnightCodes(self, knights, targets, pins, buffer, count):
+        for square in Bitboards.iterSquares(knights):
+            if square not in pins:
+                for target in Bitboards.iterSquares(AttackTables.KNIGHT_ATTACKS[square] & targets):
+                    buffer[count] = square | target << 6
+                    count += 1
+        return count
+
+    """Bishop, rook and queen codes, diagonal and straight hold the pieces moving along each kind of line"""
+
+    def generateSliderCodes(self, diagonal, straight, occupied, allowed, pins, buffer, count):
+        for square in Bitboards.iterSquares(diagonal):
+            targets = AttackTables.bishopAttacks(square, occupied) & allowed
+            if square in pins:
+                targets &= pins[square]
+            for target in Bitboards.iterSquares(targets):
+                buffer[count] = square | target << 6
+                count += 1
+
+        for square in Bitboards.iterSquares(straight):
+            targets = AttackTables.rookAttacks(square, occupied) & allowed
+            if square in pins:
+                targets &= pins[square]
+            for target in Bitboards.iterSquares(targets):
+                buffer[count] = square | target << 6
+                count += 1
+        return count
+
+    """Pushes, captures and promotions landing on pawnMask, en passant is generated separately"""
+
+    def generatePawnCodes(self, pawns, occupied, enemy, pawnMask, pins, buffer, count):
+        if self.whiteToMove:
+            color, forward, startRow, lastRow = Bitboards.WHITE, -8, 6, 0
+        else:
+            color, forward, startRow, lastRow = Bitboards.BLACK, 8, 1, 7
+        pawnAttacks = AttackTables.PAWN_ATTACKS[color]
+        for square in Bitboards.iterSquares(pawns & ~Bitboards.ROWS[lastRow]):
+            targets = pawnAttacks[square] & enemy
+            push = square + forward
+            if not occupied >> push & 1:
+                targets |= 1 << push
+                if square >> 3 == startRow and not occupied >> (push + forward) & 1:
+                    targets |= 1 << (push + forward)
+
+            for target in Bitboards.iterSquares(targets & pawnMask & pins.get(square, Bitboards.FULL)):
+                if target >> 3 == lastRow:
+                    for promotion in range(4):
+                        buffer[count] = square | target << 6 | promotion << 12 | CODE_PROMOTION
+                        count += 1
+                else:
+                    buffer[count] = square | target << 6
+                    count += 1
+        return count
+
+    def generateEnpassantCodes(self, kingSquare, bitboards, occupancy, buffer, count):
+        color = Bitboards.WHITE if self.whiteToMove else Bitboards.BLACK
+        epSquare = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+        # the pawns that could capture onto the en passant square are the ones an enemy pawn there would attack
+        for square in Bitboards.iterSquares(AttackTables.PAWN_ATTACKS[1 - color][epSquare] & bitboards[6 * color]):
+            if self.enpassantIsLegal(square, epSquare, kingSquare, bitboards, occupancy):
+                buffer[count] = square | epSquare << 6 | CODE_ENPASSANT
+                count += 1
+        return count
+
+    def generateCastleCodes(self, kingSquare, attacked, rooks, occupied, buffer, count):
+        if self.whiteToMove:
+            kingSide, queenSide, home = self.whiteCanCastleKing, self.whiteCanCastleQueen, 60
+        else:
+            kingSide, queenSide, home = self.blackCanCastleKing, self.blackCanCastleQueen, 4
+        if kingSquare != home:
+            return count
+
+        if kingSide and rooks >> (home + 3) & 1 and not occupied & (0b11 << (home + 1)) and \
+                not attacked & (0b11 << (home + 1)):
+            buffer[count] = home | (home + 2) << 6 | CODE_CASTLE
+            count += 1
+        if queenSide and rooks >> (home - 4) & 1 and not occupied & (0b111 << (home - 3)) and \
+                not attacked & (0b11 << (home - 2)):
+            buffer[count] = home | (home - 2) << 6 | CODE_CASTLE
+            count += 1
+        return count
+
+    """
+    Finds the pieces pinned to the king. Returns a dict from pinned square to the squares it may still move to,
+    which are the squares between the king and the pinner plus the pinner itself.
+    """
+
+    def getPins(self, kingSquare, bitboards, occupancy, color):
+        pins = {}
+        offset = 6 * (1 - color)
+        queens = bitboards[offset + 4]
+        snipers = ((AttackTables.bishopAttacks(kingSquare, 0) & (bitboards[offset + 2] | queens))
+                   | (AttackTables.rookAttacks(kingSquare, 0) & (bitboards[offset + 3] | queens)))
+
+        for sniper in Bitboards.iterSquares(snipers):
+            between = AttackTables.BETWEEN[kingSquare][sniper]
+            blockers = between & occupancy[Bitboards.BOTH]
+            # exactly one blocker, and it is ours
+            if blockers and not blockers & (blockers - 1) and blockers & occupancy[color]:
+                pins[blockers.bit_length() - 1] = between | (1 << sniper)
+        return pins
+
+    """
+    En passant removes two pawns from the same row, which can expose the king along that row in a way no pin catches,
+    so the position after the capture is checked directly
+    """
+
+    def enpassantIsLegal(self, fromSquare, toSquare, kingSquare, bitboards, occupancy):
+        if kingSquare < 0:
+            return True
+
+        # the captured pawn stands on the row the capturing pawn starts from, in the column it lands on
+        capturedBit = 1 << ((fromSquare & ~7) | (toSquare & 7))
+        occupiedAfter = (occupancy[Bitboards.BOTH] ^ (1 << fromSquare) ^ capturedBit) | (1 << toSquare)
+
+        enemy = Bitboards.BLACK if self.whiteToMove else Bitboards.WHITE
+        afterCapture = list(bitboards)
+        afterCapture[6 * enemy] &= ~capturedBit
+        return not AttackTables.attackersOf(kingSquare, afterCapture, enemy, occupiedAfter)
+
+    def inCheck(self):
+        bitboards, occupancy = self.getPositionBitboards()
+        color = Bitboards.WHITE if self.whiteToMove else Bitboards.BLACK
+        kingBitboard = bitboards[6 * color + 5]
+        if not kingBitboard:
+            return False
+        return bool(AttackTables.attackersOf(kingBitboard.bit_length() - 1, bitboards, 1 - color,
+                                             occupancy[Bitboards.BOTH]))
+
+    """
+    How often the current position occurred before with the same side to move. Only positions since the last capture
+    or pawn move can repeat, and their keys are on the undo stack (last item of each entry).
+    """
+
+    def repetitions(self):
+        count = 0
+        stack = self.undoStack
+        index = len(stack) - 2
+        while index >= 0 and index >= len(stack) - self.halfmoveClock:
+            if stack[index][-1] == self.zobrist:
+                count += 1
+            index -= 2
+        return count
+
+    """Piece bitboards and occupancy for the position, built from the list board when the backend has none"""
+
+    def getPositionBitboards(self):
+        if self.bitboards is not None:
+            return self.bitboards, self.occupancy
+        bitboards = Bitboards.boardToBitboards(self.board)
+        return bitboards, Bitboards.occupancyOf(bitboards)
 
     """
     gets moves, not considering checks
-    
-    validate is to keep console logs clean of validation checks
     """
 
-    def getAllPossibleMoves(self, validate=False):
+    def getAllPossibleMoves(self):
         moves = []
 
+        if self.bitboards is not None:
+            self.getBitboardMoves(moves)
+        else:
+            self.getListMoves(moves)
+
+        if self.enpassantPossible is not None:
+            self.enpeasant(moves)
+
+        return moves
+
+    """Scans the list board and adds the moves of every piece of the side to move"""
+
+    def getListMoves(self, moves):
         for row in range(len(self.board)):
             for col in range(len(self.board[row])):
                 turn = self.board[row][col][0]
@@ -151,202 +657,163 @@ class GameState():
                     if piece == 'K':
                         self.getKingMoves(row, col, moves)
 
-        if len(self.moveLog) != 0 and self.moveLog[-1].pieceMoved[1] == 'p' and (
-                self.moveLog[-1].startRow - self.moveLog[-1].endRow) in (-2, 2):
-            self.enpeasant(moves, validate=validate)
-            if not validate:
-                print("Searching for enpeasant")
+    """
+    Bitboard version of getListMoves. Produces the same moves, generated from the AttackTables masks instead of string compares
+    """
+
+    def getBitboardMoves(self, moves):
+        bitboards = self.bitboards
+        occupied = self.occupancy[Bitboards.BOTH]
+        empty = Bitboards.FULL ^ occupied
+        if self.whiteToMove:
+            own = self.occupancy[Bitboards.WHITE]
+            enemy = self.occupancy[Bitboards.BLACK]
+            offset = 0
         else:
-            if not validate:
-                print("No enpeasant")
+            own = self.occupancy[Bitboards.BLACK]
+            enemy = self.occupancy[Bitboards.WHITE]
+            offset = 6
+        notOwn = Bitboards.FULL ^ own
 
-        return moves
+        self.getBitboardPawnMoves(bitboards[offset], empty, enemy, moves)
+        self.getBitboardKnightMoves(bitboards[offset + 1], notOwn, moves)
+        self.getBitboardSliderMoves(bitboards[offset + 2], bitboards[offset + 3], bitboards[offset + 4], occupied,
+                                    notOwn, moves)
+        self.getBitboardKingMoves(bitboards[offset + 5], notOwn, moves)
 
-    """Get pawn moves for pawn located at position and add moves to list"""
+    def getBitboardKnightMoves(self, knights, notOwn, moves):
+        for square in Bitboards.iterSquares(knights):
+            self.addBitboardMoves(square, AttackTables.KNIGHT_ATTACKS[square] & notOwn, moves)
+
+    """Bishop, rook and queen moves, queens move along both kinds of line"""
+
+    def getBitboardSliderMoves(self, bishops, rooks, queens, occupied, notOwn, moves):
+        for square in Bitboards.iterSquares(bishops | queens):
+            self.addBitboardMoves(square, AttackTables.bishopAttacks(square, occupied) & notOwn, moves)
+
+        for square in Bitboards.iterSquares(rooks | queens):
+            self.addBitboardMoves(square, AttackTables.rookAttacks(square, occupied) & notOwn, moves)
+
+    def getBitboardKingMoves(self, kings, notOwn, moves):
+        for square in Bitboards.iterSquares(kings):
+            self.addBitboardMoves(square, AttackTables.KING_ATTACKS[square] & notOwn, moves)
+            if self.whiteToMove:
+                self.castleWhiteChecker(moves)
+            else:
+                self.castleBlackChecker(moves)
 
-    # TODO and promotions
+    """Pawn pushes and captures for every pawn of the side to move at once"""
+
+    def getBitboardPawnMoves(self, pawns, empty, enemy, moves):
+        if self.whiteToMove:
+            singles = Bitboards.north(pawns) & empty
+            doubles = Bitboards.north(singles & Bitboards.ROWS[5]) & empty
+            self.addPawnMoves(singles, 8, moves)
+            self.addPawnMoves(doubles, 16, moves)
+            self.addPawnMoves(Bitboards.northWest(pawns) & enemy, 9, moves)
+            self.addPawnMoves(Bitboards.northEast(pawns) & enemy, 7, moves)
+        else:
+            singles = Bitboards.south(pawns) & empty
+            doubles = Bitboards.south(singles & Bitboards.ROWS[2]) & empty
+            self.addPawnMoves(singles, -8, moves)
+            self.addPawnMoves(doubles, -16, moves)
+            self.addPawnMoves(Bitboards.southWest(pawns) & enemy, -7, moves)
+            self.addPawnMoves(Bitboards.southEast(pawns) & enemy, -9, moves)
+
+    """Adds a move for every target square, the pawn started back square + distance"""
+
+    def addPawnMoves(self, targets, distance, moves):
+        for square in Bitboards.iterSquares(targets):
+            self.addPawnMove(divmod(square + distance, 8), divmod(square, 8), moves)
+
+    def addBitboardMoves(self, square, targets, moves):
+        start = divmod(square, 8)
+        for target in Bitboards.iterSquares(targets):
+            moves.append(Move(start, divmod(target, 8), self.board))
+
+    """Get pawn moves for pawn located at position and add moves to list"""
 
     def getPawnMoves(self, row, col, moves):
+        # pawns are promoted on the last row, this only guards hand built boards from wrapping around to the other side
+        if row == (0 if self.whiteToMove else 7):
+            return
+
         if self.whiteToMove:
             # non capture movement
             if self.board[row - 1][col] == "--":
-                moves.append(Move((row, col), (row - 1, col), self.board))
+                self.addPawnMove((row, col), (row - 1, col), moves)
                 if row == 6 and self.board[row - 2][col] == "--":
-                    moves.append(Move((row, col), (row - 2, col), self.board))
+                    self.addPawnMove((row, col), (row - 2, col), moves)
             # captures
             if col - 1 >= 0 and self.board[row - 1][col - 1][0] == "b":
-                moves.append(Move((row, col), (row - 1, col - 1), self.board))
+                self.addPawnMove((row, col), (row - 1, col - 1), moves)
             if col + 1 < 8 and self.board[row - 1][col + 1][0] == "b":
-                moves.append(Move((row, col), (row - 1, col + 1), self.board))
+                self.addPawnMove((row, col), (row - 1, col + 1), moves)
 
         else:
             # non capture movement
             if self.board[row + 1][col] == "--":
-                moves.append(Move((row, col), (row + 1, col), self.board))
+                self.addPawnMove((row, col), (row + 1, col), moves)
                 if row == 1 and self.board[row + 2][col] == "--":
-                    moves.append(Move((row, col), (row + 2, col), self.board))
+                    self.addPawnMove((row, col), (row + 2, col), moves)
 
             # captures
             if col - 1 >= 0 and self.board[row + 1][col - 1][0] == "w":
-                moves.append(Move((row, col), (row + 1, col - 1), self.board))
+                self.addPawnMove((row, col), (row + 1, col - 1), moves)
             if col + 1 < 8 and self.board[row + 1][col + 1][0] == "w":
-                moves.append(Move((row, col), (row + 1, col + 1), self.board))
+                self.addPawnMove((row, col), (row + 1, col + 1), moves)
+
+    """Adds the move, or one move per promotion piece when the pawn reaches the last row"""
+
+    def addPawnMove(self, start, end, moves):
+        if end[0] == 0 or end[0] == 7:
+            for choice in PROMOTION_PIECES:
+                moves.append(Move(start, end, self.board, pawnPromotion=True, promotionChoice=choice))
+        else:
+            moves.append(Move(start, end, self.board))
 
-    # TODO
     """Gets possible enpeasant moves"""
 
-    def enpeasant(self, moves, validate=False):
-        pawnMoved = (self.moveLog[-1].endRow, self.moveLog[-1].endCol)
+    def enpeasant(self, moves):
+        # the pawn that just moved two squares stands one row past the square it skipped
+        epRow, epCol = self.enpassantPossible
+        pawnMoved = (epRow + 1, epCol) if self.whiteToMove else (epRow - 1, epCol)
         if self.whiteToMove:
             # pawn to left
             if pawnMoved[1] - 1 >= 0 and self.board[pawnMoved[0]][pawnMoved[1] - 1] == 'wp':
                 moves.append(Move((pawnMoved[0], pawnMoved[1] - 1), (pawnMoved[0] - 1, pawnMoved[1]), self.board,
                                   enpassant=True))
 
-                if not validate:
-                    print("Enpeasant to left")
-
             # pawn to right
             if pawnMoved[1] + 1 < 8 and self.board[pawnMoved[0]][pawnMoved[1] + 1] == 'wp':
                 moves.append(Move((pawnMoved[0], pawnMoved[1] + 1), (pawnMoved[0] - 1, pawnMoved[1]), self.board,
                                   enpassant=True))
 
-                if not validate:
-                    print("Enpeasant to right")
-
         else:
             # pawn to left
             if pawnMoved[1] - 1 >= 0 and self.board[pawnMoved[0]][pawnMoved[1] - 1] == 'bp':
                 moves.append(Move((pawnMoved[0], pawnMoved[1] - 1), (pawnMoved[0] + 1, pawnMoved[1]), self.board,
                                   enpassant=True))
 
-                if not validate:
-                    print("Enpeasant to left")
-
             # pawn to right
             if pawnMoved[1] + 1 < 8 and self.board[pawnMoved[0]][pawnMoved[1] + 1] == 'bp':
                 moves.append(Move((pawnMoved[0], pawnMoved[1] + 1), (pawnMoved[0] + 1, pawnMoved[1]), self.board,
                                   enpassant=True))
 
-                if not validate:
-                    print("Enpeasant to right")
-
     """Get moves for knight located at position and add moves to list"""
 
     def getKnightMoves(self, row, col, moves):
-        if row - 2 >= 0 and col - 1 >= 0 and (self.board[row - 2][col - 1][0] == "-" or self.board[row - 2][col - 1][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row - 2, col - 1), self.board))
-
-        if row - 2 >= 0 and col + 1 < 8 and (self.board[row - 2][col + 1][0] == "-" or self.board[row - 2][col + 1][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row - 2, col + 1), self.board))
-
-        if row + 2 < 8 and col - 1 >= 0 and (self.board[row + 2][col - 1][0] == "-" or self.board[row + 2][col - 1][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row + 2, col - 1), self.board))
-
-        if row + 2 < 8 and col + 1 < 8 and (self.board[row + 2][col + 1][0] == "-" or self.board[row + 2][col + 1][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row + 2, col + 1), self.board))
-
-        if row - 1 >= 0 and col - 2 >= 0 and (self.board[row - 1][col - 2][0] == "-" or self.board[row - 1][col - 2][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row - 1, col - 2), self.board))
-
-        if row - 1 >= 0 and col + 2 < 8 and (self.board[row - 1][col + 2][0] == "-" or self.board[row - 1][col + 2][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row - 1, col + 2), self.board))
-
-        if row + 1 < 8 and col - 2 >= 0 and (self.board[row + 1][col - 2][0] == "-" or self.board[row + 1][col - 2][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row + 1, col - 2), self.board))
-
-        if row + 1 < 8 and col + 2 < 8 and (self.board[row + 1][col + 2][0] == "-" or self.board[row + 1][col + 2][
-            0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (row + 1, col + 2), self.board))
+        self.addTargetMoves(row, col, AttackTables.KNIGHT_TARGETS[row * 8 + col], moves)
 
     """Get moves for bishop located at position and add moves to list"""
 
     def getBishopMoves(self, row, col, moves):
-        r = row + 1
-        c = col + 1
-        while r < 8 and c < 8 and self.board[r][c] == "--":
-            moves.append(Move((row, col), (r, c), self.board))
-            r += 1
-            c += 1
-
-        if r < 8 and c < 8 and self.board[r][c][0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove):
-            moves.append(Move((row, col), (r, c), self.board))
-
-        r = row + 1
-        c = col - 1
-        while r < 8 and c >= 0 and self.board[r][c] == "--":
-            moves.append(Move((row, col), (r, c), self.board))
-            r += 1
-            c -= 1
-
-        if r < 8 and c >= 0 and self.board[r][c][0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove):
-            moves.append(Move((row, col), (r, c), self.board))
-
-        r = row - 1
-        c = col + 1
-        while r >= 0 and c < 8 and self.board[r][c] == "--":
-            moves.append(Move((row, col), (r, c), self.board))
-            r -= 1
-            c += 1
-
-        if r >= 0 and c < 8 and self.board[r][c][0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove):
-            moves.append(Move((row, col), (r, c), self.board))
-
-        r = row - 1
-        c = col - 1
-        while r >= 0 and c >= 0 and self.board[r][c] == "--":
-            moves.append(Move((row, col), (r, c), self.board))
-            r -= 1
-            c -= 1
-
-        if r >= 0 and c >= 0 and self.board[r][c][0] == "b" * self.whiteToMove + "w" * (not self.whiteToMove):
-            moves.append(Move((row, col), (r, c), self.board))
+        self.addRayMoves(row, col, AttackTables.BISHOP_RAYS[row * 8 + col], moves)
 
     """Get moves for rook located at position and add moves to list"""
 
     def getRookMoves(self, row, col, moves):
-        r = row
-        c = col + 1
-        while c < 8 and self.board[r][c] == BLANK_SPACE:
-            moves.append(Move((row, col), (r, c), self.board))
-            c += 1
-
-        if c < 8 and self.board[r][c][0] == ("b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (r, c), self.board))
-
-        r = row
-        c = col - 1
-        while c >= 0 and self.board[r][c] == BLANK_SPACE:
-            moves.append(Move((row, col), (r, c), self.board))
-            c -= 1
-
-        if c >= 0 and self.board[r][c][0] == ("b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (r, c), self.board))
-
-        r = row + 1
-        c = col
-        while r < 8 and self.board[r][c] == BLANK_SPACE:
-            moves.append(Move((row, col), (r, c), self.board))
-            r += 1
-
-        if r < 8 and self.board[r][c][0] == ("b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (r, c), self.board))
-
-        r = row - 1
-        c = col
-        while r >= 0 and self.board[r][c] == BLANK_SPACE:
-            moves.append(Move((row, col), (r, c), self.board))
-            r -= 1
-
-        if r >= 0 and self.board[r][c][0] == ("b" * self.whiteToMove + "w" * (not self.whiteToMove)):
-            moves.append(Move((row, col), (r, c), self.board))
+        self.addRayMoves(row, col, AttackTables.ROOK_RAYS[row * 8 + col], moves)
 
     """Get moves for queen located at position and add moves to list"""
 
@@ -356,20 +823,8 @@ class GameState():
 
     """Get moves for king located at position and add moves to list"""
 
-    # TODO castling
-
     def getKingMoves(self, row, col, moves):
-        aroundKing = (
-        (row + 1, col + 1), (row + 1, col), (row, col + 1), (row + 1, col - 1), (row - 1, col + 1), (row - 1, col),
-        (row, col - 1), (row - 1, col - 1))
-
-        for square in aroundKing:
-            try:
-                if square[0] >= 0 and square[1] >= 0 and self.board[square[0]][square[1]][0] != (
-                        "w" * self.whiteToMove + "b" * (not self.whiteToMove)):
-                    moves.append(Move((row, col), square, self.board))
-            except IndexError:
-                pass
+        self.addTargetMoves(row, col, AttackTables.KING_TARGETS[row * 8 + col], moves)
 
         if self.whiteToMove:
             self.castleWhiteChecker(moves)
@@ -377,25 +832,68 @@ class GameState():
             self.castleBlackChecker(moves)
 
     """These two functions see if the king can castle for their respective color
-    Doesn't check if king can be taken after because that is handled in valid moves, just if the other squares are under attack"""
+    Only checks castling rights and that the squares between king and rook are empty, getValidMoves rejects castling
+    out of, through or into check"""
 
     def castleWhiteChecker(self, moves):
-        pass
+        self.castleChecker(7, 'w', self.whiteCanCastleKing, self.whiteCanCastleQueen, moves)
 
     def castleBlackChecker(self, moves):
-        pass
+        self.castleChecker(0, 'b', self.blackCanCastleKing, self.blackCanCastleQueen, moves)
+
+    def castleChecker(self, row, color, kingSide, queenSide, moves):
+        if self.board[row][4] != color + 'K':
+            return
+
+        if kingSide and self.board[row][7] == color + 'R' and self.board[row][5] == self.board[row][6] == BLANK_SPACE:
+            moves.append(Move((row, 4), (row, 6), self.board, castle=True))
+
+        if queenSide and self.board[row][0] == color + 'R' and \
+                self.board[row][1] == self.board[row][2] == self.board[row][3] == BLANK_SPACE:
+            moves.append(Move((row, 4), (row, 2), self.board, castle=True))
+
+    """Adds a move to every target square that is empty or holds an enemy piece"""
+
+    def addTargetMoves(self, row, col, targets, moves):
+        enemy = 'b' if self.whiteToMove else 'w'
+        for r, c in targets:
+            target = self.board[r][c]
+            if target == BLANK_SPACE or target[0] == enemy:
+                moves.append(Move((row, col), (r, c), self.board))
+
+    """Walks each ray until it leaves the board or hits a piece, which is included if it is an enemy"""
+
+    def addRayMoves(self, row, col, rays, moves):
+        enemy = 'b' if self.whiteToMove else 'w'
+        for ray in rays:
+            for r, c in ray:
+                target = self.board[r][c]
+                if target == BLANK_SPACE:
+                    moves.append(Move((row, col), (r, c), self.board))
+                    continue
+                if target[0] == enemy:
+                    moves.append(Move((row, col), (r, c), self.board))
+                break
 
 
 class Move():
+    """
+    A move is identified by a 16 bit code: start square (row * 8 + col) in bits 0-5, end square in bits 6-11,
+    promotion piece (index into CODE_PROMOTION_PIECES) in bits 12-13 and the kind of move in bits 14-15.
+    Move objects wrap a code with the details the GUI and makeMove need, search can work on the codes alone.
+    """
+
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "enpassant",
+                 "pawnPromotion", "promotionChoice", "castle", "code", "moveID")
+
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSquare, endSquare, board, enpassant=False, pawnPromotion=False, castle=False):
+    def __init__(self, startSquare, endSquare, board, enpassant=False, pawnPromotion=False, castle=False,
+                 promotionChoice="Q"):
         self.enpassant = enpassant
-        self.pawnPromotion = pawnPromotion
-        self.castle = castle
 
         self.startRow = startSquare[0]
         self.startCol = startSquare[1]
@@ -410,8 +908,47 @@ class Move():
         else:
             self.pieceCaptured = board[self.endRow][self.endCol]
 
-        # basically a hash function
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        # promotions and castling can be told from the board, so moves built from clicks get them right too
+        self.pawnPromotion = pawnPromotion or (self.pieceMoved[1] == 'p' and self.endRow in (0, 7))
+        self.promotionChoice = promotionChoice if self.pawnPromotion else None
+        self.castle = castle or (self.pieceMoved[1] == 'K' and abs(self.startCol - self.endCol) == 2)
+
+        self.code = self.startRow * 8 + self.startCol | (self.endRow * 8 + self.endCol) << 6
+        if self.pawnPromotion:
+            self.code |= CODE_PROMOTION_PIECES.index(promotionChoice) << 12 | CODE_PROMOTION
+        elif self.enpassant:
+            self.code |= CODE_ENPASSANT
+        elif self.castle:
+            self.code |= CODE_CASTLE
+
+        # basically a hash function. Leaves out the kind of move, which a move built from clicks may not know
+        self.moveID = self.code & 0x3FFF
+
+    """
+    Builds the Move for a code from generateMoveCodes in the current position. The code already says what kind of
+    move it is, so the fields are filled in directly instead of being worked out again like __init__ does.
+    """
+
+    @classmethod
+    def fromCode(cls, code, board):
+        move = cls.__new__(cls)
+        kind = code & CODE_KIND_MASK
+        move.startRow = startRow = code >> 3 & 7
+        move.startCol = startCol = code & 7
+        move.endRow = endRow = code >> 9 & 7
+        move.endCol = endCol = code >> 6 & 7
+        move.pieceMoved = pieceMoved = board[startRow][startCol]
+        move.enpassant = kind == CODE_ENPASSANT
+        if move.enpassant:
+            move.pieceCaptured = "wp" if pieceMoved == "bp" else "bp"
+        else:
+            move.pieceCaptured = board[endRow][endCol]
+        move.pawnPromotion = kind == CODE_PROMOTION
+        move.promotionChoice = CODE_PROMOTION_PIECES[code >> 12 & 3] if move.pawnPromotion else None
+        move.castle = kind == CODE_CASTLE
+        move.code = code
+        move.moveID = code & 0x3FFF
+        return move
 
     """
     Overiding equals operator
@@ -424,9 +961,34 @@ class Move():
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getRankFile(self, row, col):
         return self.colsToFiles[col] + self.rowsToRanks[row]
 
-    # TODO update this to get full chess notation
+    # coordinate notation ("e7e8q"), PGN.moveToSAN gives standard algebraic notation
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.pawnPromotion:
+            notation += self.promotionChoice.lower()
+        return notation
+
+
+"""Coordinate notation of a move code, the same text getChessNotation gives for its Move"""
+
+
+def codeNotation(code):
+    notation = ""
+    for square in (code & 63, code >> 6 & 63):
+        notation += Move.colsToFiles[square & 7] + Move.rowsToRanks[square >> 3]
+    if code & CODE_KIND_MASK == CODE_PROMOTION:
+        notation += CODE_PROMOTION_PIECES[code >> 12 & 3].lower()
+    return notation
+
+
+"""A buffer generateMoveCodes can fill, big enough for any legal position"""
+
+
+def newMoveBuffer():
+    return array.array("H", bytes(2 * MAX_MOVES))
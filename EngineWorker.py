@@ -0,0 +1,163 @@
+"""
+Runs Search on a background thread so the pygame loop keeps drawing and handling input while a bot thinks.
+
+The GUI sends requests and polls for the answer once per frame, nothing it calls blocks on the search:
+
+    engine = EngineWorker()
+    engine.requestSearch(gs, timeLimit=2.0)
+    ...
+    result = engine.poll()   # None until the search is done
+
+A new request replaces the one before it. stop() makes the running search answer with the best move found so far,
+cancel() drops it without an answer. While the opponent thinks, requestPonder searches the position after the reply
+the last search expected. When the opponent does play that move, the next requestSearch keeps the ponder search
+running with a time limit instead of starting over.
+"""
+
+import copy
+import queue
+import threading
+import time
+
+import Search
+
+
+class EngineRequest():
+    def __init__(self, gs, maxDepth, timeLimit, ponder):
+        # a copy, the GUI keeps changing its own GameState while the search runs
+        self.gs = gs
+        self.maxDepth = maxDepth
+        self.timeLimit = timeLimit
+        self.ponder = ponder
+        # perf_counter time a ponder hit gave the search to finish by
+        self.deadline = None
+        self.cancelled = False
+        self.stopped = False
+        self.result = None
+
+
+class EngineWorker():
+    def __init__(self, searcher=None):
+        self.searcher = searcher if searcher is not None else Search.Searcher()
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        # the latest request, the one being searched and a finished result the GUI hasn't polled yet
+        self.current = None
+        self.running = None
+        self.result = None
+        self.thread = threading.Thread(target=self.run, name="EngineWorker", daemon=True)
+        self.thread.start()
+
+    """
+    Searches gs for the side to move, the answer comes from poll(). If a ponder search is running on the same
+    position it carries on with timeLimit.
+    """
+
+    def requestSearch(self, gs, maxDepth=Search.MAX_PLY, timeLimit=None):
+        with self.lock:
+            request = self.current
+            if request is not None and request.ponder and not request.cancelled and \
+                    request.gs.zobrist == gs.zobrist and len(request.gs.moveLog) == len(gs.moveLog):
+                self.ponderHit(request, timeLimit)
+                return
+        self.submit(EngineRequest(copy.deepcopy(gs), maxDepth, timeLimit, False))
+
+    """Searches the position after move without a limit until the next request, nothing is answered meanwhile"""
+
+    def requestPonder(self, gs, move):
+        gs = copy.deepcopy(gs)
+        gs.makeMove(move)
+        self.submit(EngineRequest(gs, Search.MAX_PLY, None, True))
+
+    def submit(self, request):
+        self.cancel()
+        with self.lock:
+            self.current = request
+        self.requests.put(request)
+
+    """Called with the lock held when the opponent played the move a ponder search expected"""
+
+    def ponderHit(self, request, timeLimit):
+        request.ponder = False
+        request.timeLimit = timeLimit
+        if request.result is not None:
+            # the ponder search already finished, it has nothing left to add
+            self.result = request.result
+        elif timeLimit is not None:
+            # the search may still be about to set its own limits and clear this deadline, onIteration puts it back
+            request.deadline = time.perf_counter() + timeLimit
+            if self.running is request:
+                self.searcher.deadline = request.deadline
+
+    """Returns the SearchResult of the current request once it is done, and None before that or after it was taken"""
+
+    def poll(self):
+        with self.lock:
+            result = self.result
+            self.result = None
+            return result
+
+    """True while a search the GUI is waiting for is running"""
+
+    def isThinking(self):
+        with self.lock:
+            request = self.current
+            return request is not None and not request.ponder and not request.cancelled and request.result is None
+
+    """Makes the running search answer now with the best move found so far. A ponder search is cancelled instead."""
+
+    def stop(self):
+        with self.lock:
+            request = self.current
+            if request is None or request.cancelled:
+                return
+            if request.ponder:
+                request.cancelled = True
+            request.stopped = True
+            if self.running is request:
+                self.searcher.stop()
+
+    """Drops the current request without an answer"""
+
+    def cancel(self):
+        with self.lock:
+            request = self.current
+            if request is not None:
+                request.cancelled = True
+                if self.running is request:
+                    self.searcher.stop()
+            self.current = None
+            self.result = None
+
+    def close(self):
+        self.cancel()
+        self.requests.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+
+            with self.lock:
+                if request.cancelled:
+                    continue
+                self.running = request
+
+            def onIteration(result):
+                # a stop that came in before the search reset its own flag still gets through here
+                if request.cancelled or request.stopped:
+                    self.searcher.stop()
+                if request.deadline is not None:
+                    self.searcher.deadline = request.deadline
+
+            result = self.searcher.search(request.gs, request.maxDepth, request.timeLimit, onIteration=onIteration)
+
+            with self.lock:
+                self.running = None
+                if request.cancelled:
+                    continue
+                request.result = result
+                if not request.ponder:
+                    self.result = result
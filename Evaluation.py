@@ -0,0 +1,199 @@
+"""
+Static evaluation: material plus piece-square tables, in centipawns.
+
+Every piece on a square is worth a fixed amount (SQUARE_SCORES), so a position's score is a sum over its pieces and a
+move only changes the few terms for the squares it touches. GameState keeps the score up to date in makeMove with
+moveDelta and restores it from the undo stack in undoMove, so evaluating a leaf is a lookup instead of a scan of the
+board. evaluatePacked scores many positions in the ChessEngine packed format at once with numpy.
+"""
+
+import Bitboards
+import ChessEngine
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+PIECE_VALUES = {"p": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+
+# Bonuses for white pieces, laid out like GameState.board with rank 8 in the first row. Black uses the same tables
+# mirrored top to bottom.
+PAWN_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+)
+QUEEN_TABLE = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+KING_TABLE = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+)
+
+PIECE_TABLES = {"p": PAWN_TABLE, "N": KNIGHT_TABLE, "B": BISHOP_TABLE, "R": ROOK_TABLE, "Q": QUEEN_TABLE,
+                "K": KING_TABLE}
+
+
+"""Value plus square bonus of every piece on every square, positive for white and negative for black"""
+
+
+def buildSquareScores():
+    scores = []
+    for piece in Bitboards.PIECES:
+        table = PIECE_TABLES[piece[1]]
+        value = PIECE_VALUES[piece[1]]
+        if piece[0] == 'w':
+            scores.append([value + table[square] for square in range(64)])
+        else:
+            # square ^ 56 flips the row
+            scores.append([-(value + table[square ^ 56]) for square in range(64)])
+    return scores
+
+
+# SQUARE_SCORES[Bitboards.PIECE_INDEX[piece]][row * 8 + col]
+SQUARE_SCORES = buildSquareScores()
+
+
+"""Computes the score of a position from scratch, from white's point of view"""
+
+
+def evaluatePosition(gs):
+    score = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != "--":
+                score += SQUARE_SCORES[Bitboards.PIECE_INDEX[piece]][row * 8 + col]
+    return score
+
+
+"""How much a move changes the score from white's point of view, including the captured piece and a castling rook"""
+
+
+def moveDelta(move):
+    moved = Bitboards.PIECE_INDEX[move.pieceMoved]
+    fromSquare = move.startRow * 8 + move.startCol
+    toSquare = move.endRow * 8 + move.endCol
+
+    delta = -SQUARE_SCORES[moved][fromSquare]
+    if move.pawnPromotion:
+        delta += SQUARE_SCORES[Bitboards.PIECE_INDEX[move.pieceMoved[0] + move.promotionChoice]][toSquare]
+    else:
+        delta += SQUARE_SCORES[moved][toSquare]
+
+    if move.pieceCaptured != "--":
+        captureSquare = move.startRow * 8 + move.endCol if move.enpassant else toSquare
+        delta -= SQUARE_SCORES[Bitboards.PIECE_INDEX[move.pieceCaptured]][captureSquare]
+
+    if move.castle:
+        rookScores = SQUARE_SCORES[Bitboards.PIECE_INDEX[move.pieceMoved[0] + "R"]]
+        row = move.endRow * 8
+        if move.endCol == 6:
+            delta += rookScores[row + 5] - rookScores[row + 7]
+        else:
+            delta += rookScores[row + 3] - rookScores[row]
+    return delta
+
+
+"""Score of gs from the point of view of the side to move, as negamax wants it"""
+
+
+def evaluate(gs):
+    return gs.evalScore if gs.whiteToMove else -gs.evalScore
+
+
+if numpy is not None:
+    # PACKED_SCORES[packed piece code * 64 + square], packed code 0 is an empty square
+    PACKED_SCORES = numpy.array([[0] * 64] + SQUARE_SCORES, dtype=numpy.int32).ravel()
+    SQUARE_OFFSETS = numpy.arange(64, dtype=numpy.intp)
+
+
+"""
+Scores positions packed with GameState.toPacked and returns them as an int32 numpy array, from white's point of view
+or from the side to move's with relative. positions is either the records joined into one bytes-like object (a file
+read or memory mapped whole works) or a sequence of records. Records are scored chunkSize at a time to bound the
+temporary arrays.
+"""
+
+
+def evaluatePacked(positions, relative=False, chunkSize=65536):
+    if numpy is None:
+        raise ImportError("evaluatePacked needs numpy")
+
+    if isinstance(positions, (list, tuple)):
+        positions = b"".join(positions)
+    records = numpy.frombuffer(positions, dtype=numpy.uint8)
+    if records.size % ChessEngine.PACKED_SIZE:
+        raise ValueError("Packed positions are " + str(ChessEngine.PACKED_SIZE) + " bytes each, got " +
+                         str(records.size) + " bytes")
+    records = records.reshape(-1, ChessEngine.PACKED_SIZE)
+
+    scores = numpy.empty(len(records), dtype=numpy.int32)
+    codes = numpy.empty((min(chunkSize, len(records)), 64), dtype=numpy.intp)
+    for start in range(0, len(records), chunkSize):
+        chunk = records[start:start + chunkSize]
+        chunkCodes = codes[:len(chunk)]
+        # two squares per byte, the lower square in the low nibble
+        squares = chunk[:, :32]
+        chunkCodes[:, 0::2] = squares & 0xF
+        chunkCodes[:, 1::2] = squares >> 4
+        chunkCodes *= 64
+        chunkCodes += SQUARE_OFFSETS
+        scores[start:start + len(chunk)] = PACKED_SCORES.take(chunkCodes).sum(axis=1)
+
+    if relative:
+        # bit 0 of the flag byte after the squares is set when white is to move
+        blackToMove = (records[:, 32] & 1) == 0
+        scores[blackToMove] = -scores[blackToMove]
+    return scores
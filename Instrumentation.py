@@ -0,0 +1,255 @@
+"""
+Opt in counters and timings for the hot paths of move generation and search, to see where the time goes:
+
+    Instrumentation.enable()
+    ... perft, a search, a match ...
+    print(Instrumentation.report(searcher))
+
+enable wraps the methods named in PROBES so every call is counted and, for the timed ones, timed. disable puts the
+original methods back. Nothing is wrapped before enable, so with instrumentation off the engine runs exactly the
+code it runs without this module and pays nothing for it. Times are inclusive of whatever a method calls, and the
+counters are shared by all threads of the process.
+
+From the command line, with an optional cProfile run and a report every few seconds for long runs:
+
+    python Instrumentation.py perft --depth 4
+    python Instrumentation.py search --depth 5 --profile --dump 2
+"""
+
+import argparse
+import collections
+import contextlib
+import cProfile
+import pstats
+import sys
+import threading
+import time
+
+import ChessEngine
+import Evaluation
+import Perft
+import Search
+
+
+# probe name -> (owner, attribute, timed) of every function it wraps. Each generator probe covers both the Move
+# generators of getAllPossibleMoves and the move code generators of generateMoveCodes, which the bitboard backend's
+# getValidMoves and the search use. Calls that happen millions of times, like building a Move, are only counted:
+# timing them would cost more than the call.
+PROBES = {
+    "generate.pawn": [(ChessEngine.GameState, "getPawnMoves", True),
+                      (ChessEngine.GameState, "getBitboardPawnMoves", True),
+                      (ChessEngine.GameState, "generatePawnCodes", True)],
+    "generate.knight": [(ChessEngine.GameState, "getKnightMoves", True),
+                        (ChessEngine.GameState, "getBitboardKnightMoves", True),
+                        (ChessEngine.GameState, "generateKnightCodes", True)],
+    # the list backend's queens count as a bishop and a rook call
+    "generate.slider": [(ChessEngine.GameState, "getBishopMoves", True),
+                        (ChessEngine.GameState, "getRookMoves", True),
+                        (ChessEngine.GameState, "getBitboardSliderMoves", True),
+                        (ChessEngine.GameState, "generateSliderCodes", True)],
+    # the Move generators check castling from inside the king generators, so their king time includes it
+    "generate.king": [(ChessEngine.GameState, "getKingMoves", True),
+                      (ChessEngine.GameState, "getBitboardKingMoves", True),
+                      (ChessEngine.GameState, "generateKingCodes", True)],
+    "generate.castling": [(ChessEngine.GameState, "castleChecker", True),
+                          (ChessEngine.GameState, "generateCastleCodes", True)],
+    "generate.enpassant": [(ChessEngine.GameState, "enpeasant", True),
+                           (ChessEngine.GameState, "generateEnpassantCodes", True)],
+    "generate.codes": [(ChessEngine.GameState, "generateMoveCodes", True)],
+    # checkers, pins and attacked squares, worked out once per generation on either path
+    "legality": [(ChessEngine.GameState, "getLegalityInfo", True)],
+    # the list backend's filter over the pseudo-legal Moves, legality included
+    "legality.filter": [(ChessEngine.GameState, "filterLegalMoves", True)],
+    "makeMove": [(ChessEngine.GameState, "makeMove", True)],
+    "undoMove": [(ChessEngine.GameState, "undoMove", True)],
+    # Moves built by the generators and from clicks, and Moves built from codes by the search and the bitboard
+    # backend's getValidMoves
+    "Move": [(ChessEngine.Move, "__init__", False), (ChessEngine.Move, "fromCode", False)],
+    "evaluate": [(Evaluation, "evaluate", True)],
+    # recursive, so only counted
+    "search.negamax": [(Search.Searcher, "negamax", False)],
+    "search.quiescence": [(Search.Searcher, "quiescence", False)],
+    # a move in negamax's move loop reaching beta, so the rest of the moves are skipped
+    "search.cutoffs": [(Search.Searcher, "recordCutoff", False)],
+}
+
+calls = collections.Counter()
+seconds = collections.Counter()
+# (owner, attribute) -> the function enable replaced
+originals = {}
+
+
+def countedCalls(name, function):
+    def wrapper(*args, **kwargs):
+        calls[name] += 1
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def timedCalls(name, function):
+    perfCounter = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = perfCounter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds[name] += perfCounter() - start
+            calls[name] += 1
+    return wrapper
+
+
+def isEnabled():
+    return bool(originals)
+
+
+"""Wraps the probes named in names, all of them by default. Counters keep counting from where they were."""
+
+
+def enable(names=None):
+    for name in names or PROBES:
+        if name not in PROBES:
+            raise ValueError("unknown probe " + repr(name))
+        for owner, attribute, timed in PROBES[name]:
+            if (owner, attribute) in originals:
+                continue
+            function = owner.__dict__[attribute]
+            originals[(owner, attribute)] = function
+            # a classmethod is wrapped underneath and made a classmethod again
+            isClassMethod = isinstance(function, classmethod)
+            if isClassMethod:
+                function = function.__func__
+            if timed:
+                wrapper = timedCalls(name, function)
+            else:
+                wrapper = countedCalls(name, function)
+            setattr(owner, attribute, classmethod(wrapper) if isClassMethod else wrapper)
+
+
+def disable():
+    for (owner, attribute), function in originals.items():
+        setattr(owner, attribute, function)
+    originals.clear()
+
+
+def reset():
+    calls.clear()
+    seconds.clear()
+
+
+"""name -> (calls, seconds) of every probe hit so far, seconds is None for probes that are only counted"""
+
+
+def snapshot():
+    timed = {name for name, functions in PROBES.items() if any(function[2] for function in functions)}
+    return {name: (count, seconds[name] if name in timed else None) for name, count in calls.items()}
+
+
+"""The counters as a table, with the node and transposition table counters of searcher when one is given"""
+
+
+def report(searcher=None):
+    lines = ["%-20s %12s %10s %10s" % ("probe", "calls", "seconds", "us/call")]
+    for name, (count, total) in sorted(snapshot().items()):
+        if total is None:
+            lines.append("%-20s %12d" % (name, count))
+        else:
+            lines.append("%-20s %12d %10.3f %10.2f" % (name, count, total, total / count * 1e6 if count else 0))
+
+    if searcher is not None:
+        tt = searcher.tt
+        probes = tt.hits + tt.misses
+        lines.append("")
+        lines.append("search nodes %d, tt probes %d, hits %d (%.1f%%), collisions %d, stores %d"
+                     % (searcher.nodes, probes, tt.hits, 100 * tt.hits / probes if probes else 0, tt.collisions,
+                        tt.stores))
+    return "\n".join(lines)
+
+
+class PeriodicDump():
+    """Writes report() to stream every interval seconds from a daemon thread until closed"""
+
+    def __init__(self, interval, stream=sys.stderr, searcher=None):
+        self.interval = interval
+        self.stream = stream
+        self.searcher = searcher
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            self.stream.write(report(self.searcher) + "\n\n")
+            self.stream.flush()
+
+    def close(self):
+        self.stopEvent.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+"""
+Runs the body of the with block under cProfile. The stats are saved to path when given, else the limit most
+expensive functions sorted by sortBy are written to stream.
+"""
+
+
+@contextlib.contextmanager
+def profile(path=None, sortBy="cumulative", limit=25, stream=sys.stderr):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler, stream=stream).sort_stats(sortBy).print_stats(limit)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count and time the hot paths while running perft or a search")
+    parser.add_argument("workload", choices=("perft", "search"))
+    parser.add_argument("--fen", default=ChessEngine.START_FEN)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--backend", choices=("list", "bitboard"), default="list")
+    parser.add_argument("--probes", help="comma separated probe names out of " + ", ".join(PROBES) + ", all by default")
+    parser.add_argument("--profile", action="store_true", help="also run under cProfile and print the top functions")
+    parser.add_argument("--profile-output", help="save the cProfile stats to this file instead of printing them")
+    parser.add_argument("--dump", type=float, help="print the counters every this many seconds while running")
+    args = parser.parse_args(argv)
+
+    gs = ChessEngine.GameState.fromFEN(args.fen, args.backend)
+    searcher = Search.Searcher() if args.workload == "search" else None
+    try:
+        enable(args.probes.split(",") if args.probes else None)
+    except ValueError as error:
+        parser.error(str(error))
+
+    with contextlib.ExitStack() as stack:
+        if args.dump:
+            stack.enter_context(PeriodicDump(args.dump, sys.stdout, searcher))
+        if args.profile or args.profile_output:
+            stack.enter_context(profile(args.profile_output, stream=sys.stdout))
+        start = time.perf_counter()
+        if searcher is None:
+            nodes = Perft.perft(gs, args.depth)
+        else:
+            result = searcher.search(gs, args.depth)
+            nodes = result.nodes
+        elapsed = time.perf_counter() - start
+    disable()
+
+    print("%s depth %d: %d nodes in %.3fs\n" % (args.workload, args.depth, nodes, elapsed))
+    print(report(searcher))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
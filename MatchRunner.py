@@ -0,0 +1,384 @@
+"""
+Plays engine configurations against each other to tell whether a change made the engine stronger.
+
+Games run in parallel in a pool of worker processes, one game per task. Every opening is played twice with colors
+swapped so neither engine profits from a lucky opening. Games end on mate, stalemate, threefold repetition, the
+50 move rule, insufficient material or a ply limit. Finished games are appended to a PGN file, and after every game
+the running score, the Elo difference with its 95% error margin and the SPRT log likelihood ratio are printed. The
+match stops early once the SPRT accepts one of its hypotheses.
+
+An engine is a comma separated list of settings: name, time (seconds per move), depth, nodes, hash (MB), book (a
+Polyglot file) and tb (a Tablebase directory) for the built in Search, or cmd, a UCI engine command such as an older
+checkout's UCI.py:
+
+    python MatchRunner.py --engine1 name=new,time=0.1 --engine2 "name=old,cmd=python ../old/UCI.py,time=0.1"
+    python MatchRunner.py --engine1 depth=4 --engine2 depth=3 --games 200 --workers 8 --pgn games.pgn
+"""
+
+import argparse
+import concurrent.futures
+import math
+import os
+import subprocess
+import sys
+import time
+
+import ChessEngine
+import OpeningBook
+import PGN
+import Search
+import Tablebase
+import TranspositionTable
+
+
+# balanced positions after a few opening moves, each is played once with every color assignment
+OPENINGS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkb1r/pppppppp/5n2/8/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 1 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkb1r/pppp1ppp/5n2/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkbnr/pppppppp/8/8/2P5/8/PP1PPPPP/RNBQKBNR b KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R b KQkq - 1 1",
+]
+
+# games that last longer are adjudicated as draws
+MAX_PLIES = 400
+
+RESULT_SCORES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+UCI_OVERHEAD_SECONDS = 5.0
+
+
+"""Parses "name=new,time=0.1" into a settings dict"""
+
+
+def parseEngine(text, defaultName):
+    settings = {"name": defaultName}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key not in ("name", "cmd", "time", "depth", "nodes", "hash", "book", "tb"):
+            raise ValueError("Unknown engine setting " + repr(key) + " in " + repr(text))
+        settings[key] = value.strip()
+    if not any(key in settings for key in ("time", "depth", "nodes")):
+        raise ValueError("Engine " + repr(text) + " needs a time, depth or nodes limit")
+    return settings
+
+
+class SearchPlayer():
+    def __init__(self, settings):
+        self.searcher = Search.Searcher(TranspositionTable.TranspositionTable(int(settings.get("hash", 16))),
+                                        OpeningBook.OpeningBook(settings["book"]) if "book" in settings else None,
+                                        Tablebase.Tablebase(settings["tb"]) if "tb" in settings else None)
+        self.timeLimit = float(settings["time"]) if "time" in settings else None
+        self.maxDepth = int(settings.get("depth", Search.MAX_PLY))
+        self.maxNodes = int(settings["nodes"]) if "nodes" in settings else None
+
+    def chooseMove(self, gs, startFEN, history):
+        result = self.searcher.search(gs, self.maxDepth, self.timeLimit, self.maxNodes)
+        return result.bestMove.getChessNotation()
+
+    def close(self):
+        if self.searcher.book is not None:
+            self.searcher.book.close()
+        if self.searcher.tablebase is not None:
+            self.searcher.tablebase.close()
+
+
+"""Drives an external UCI engine through its stdin and stdout"""
+
+
+class UCIPlayer():
+    def __init__(self, settings):
+        self.settings = settings
+        self.process = subprocess.Popen(settings["cmd"], shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        self.send("uci")
+        self.waitFor("uciok")
+        if "hash" in settings:
+            self.send("setoption name Hash value " + settings["hash"])
+        if "book" in settings:
+            self.send("setoption name BookFile value " + settings["book"])
+        if "tb" in settings:
+            self.send("setoption name TablebasePath value " + settings["tb"])
+        self.send("ucinewgame")
+        self.send("isready")
+        self.waitFor("readyok")
+
+    def send(self, line):
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+
+    def waitFor(self, prefix):
+        for line in self.process.stdout:
+            if line.startswith(prefix):
+                return line.split()
+        raise RuntimeError("UCI engine " + repr(self.settings["cmd"]) + " exited before sending " + prefix)
+
+    def chooseMove(self, gs, startFEN, history):
+        self.send("position fen " + startFEN + (" moves " + " ".join(history) if history else ""))
+        limits = []
+        if "time" in self.settings:
+            limits.append("movetime " + str(int(float(self.settings["time"]) * 1000)))
+        if "depth" in self.settings:
+            limits.append("depth " + self.settings["depth"])
+        if "nodes" in self.settings:
+            limits.append("nodes " + self.settings["nodes"])
+        self.send("go " + " ".join(limits))
+        return self.waitFor("bestmove")[1]
+
+    def close(self):
+        try:
+            self.send("quit")
+            self.process.wait(UCI_OVERHEAD_SECONDS)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+def makePlayer(settings):
+    return UCIPlayer(settings) if "cmd" in settings else SearchPlayer(settings)
+
+
+"""Only kings, or kings and a single minor piece, can never mate"""
+
+
+def insufficientMaterial(gs):
+    pieces = [piece[1] for row in gs.board for piece in row if piece != ChessEngine.BLANK_SPACE]
+    return len(pieces) == 2 or (len(pieces) == 3 and ("N" in pieces or "B" in pieces))
+
+
+"""Returns (result, termination) once the game in gs is over, else None"""
+
+
+def gameOver(gs, legalMoves, plies):
+    if not legalMoves:
+        if gs.inCheck():
+            return ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if gs.halfmoveClock >= 100:
+        return "1/2-1/2", "50 move rule"
+    if gs.repetitions() >= 2:
+        return "1/2-1/2", "threefold repetition"
+    if insufficientMaterial(gs):
+        return "1/2-1/2", "insufficient material"
+    if plies >= MAX_PLIES:
+        return "1/2-1/2", "ply limit"
+    return None
+
+
+"""
+Runs in a worker: plays one game from startFEN and returns a dict with the result, the termination and the moves in
+SAN. An engine that sends an illegal move or crashes loses the game.
+"""
+
+
+def playGame(startFEN, white, black):
+    players = {}
+    gs = ChessEngine.GameState.fromFEN(startFEN)
+    history = []
+    sanMoves = []
+    try:
+        players = {True: makePlayer(white), False: makePlayer(black)}
+        while True:
+            legalMoves = gs.getValidMoves()
+            over = gameOver(gs, legalMoves, len(history))
+            if over is not None:
+                result, termination = over
+                break
+
+            notation = players[gs.whiteToMove].chooseMove(gs, startFEN, history)
+            move = next((move for move in legalMoves if move.getChessNotation() == notation), None)
+            if move is None:
+                result = "0-1" if gs.whiteToMove else "1-0"
+                termination = "illegal move " + notation
+                break
+            sanMoves.append(PGN.moveToSAN(gs, move, legalMoves))
+            history.append(notation)
+            gs.makeMove(move)
+    except (OSError, RuntimeError) as error:
+        result = "0-1" if gs.whiteToMove else "1-0"
+        termination = "engine failure: " + str(error)
+    finally:
+        for player in players.values():
+            player.close()
+
+    return {"fen": startFEN, "white": white["name"], "black": black["name"], "result": result,
+            "termination": termination, "moves": sanMoves}
+
+
+"""Running totals from engine1's point of view"""
+
+
+class MatchScore():
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, score):
+        if score == 1.0:
+            self.wins += 1
+        elif score == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    """Mean score per game and its variance"""
+
+    def meanAndVariance(self):
+        games = self.games
+        mean = (self.wins + self.draws / 2) / games
+        variance = (self.wins * (1 - mean) ** 2 + self.draws * (0.5 - mean) ** 2 + self.losses * mean ** 2) / games
+        return mean, variance
+
+    """(Elo difference, 95% error margin), None while the score is 0% or 100% and the Elo is infinite"""
+
+    def elo(self):
+        if not self.games:
+            return None
+        mean, variance = self.meanAndVariance()
+        if mean <= 0 or mean >= 1:
+            return None
+        margin = 1.96 * math.sqrt(variance / self.games)
+        low = scoreToElo(max(mean - margin, 1e-6))
+        high = scoreToElo(min(mean + margin, 1 - 1e-6))
+        return scoreToElo(mean), (high - low) / 2
+
+    """
+    Log likelihood ratio of H1 (engine1 is elo1 stronger) against H0 (elo0 stronger), with the normal approximation
+    of the game score distribution
+    """
+
+    def llr(self, elo0, elo1):
+        if not self.games:
+            return 0.0
+        mean, variance = self.meanAndVariance()
+        if variance == 0:
+            return 0.0
+        score0 = eloToScore(elo0)
+        score1 = eloToScore(elo1)
+        return self.games * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+
+def scoreToElo(score):
+    return -400 * math.log10(1 / score - 1)
+
+
+def eloToScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+"""(lower, upper) LLR bounds, below lower H0 is accepted and above upper H1"""
+
+
+def sprtBounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+"""The opening FENs of a file with one per line, blank lines and # comments skipped"""
+
+
+def readOpenings(path):
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+
+def runMatch(args, openings=OPENINGS):
+    engine1 = parseEngine(args.engine1, "engine1")
+    engine2 = parseEngine(args.engine2, "engine2")
+
+    # each opening twice with swapped colors, as many rounds as it takes to reach the number of games
+    pairings = []
+    while len(pairings) < args.games:
+        for fen in openings:
+            pairings.append((fen, engine1, engine2))
+            pairings.append((fen, engine2, engine1))
+    pairings = pairings[:args.games]
+
+    score = MatchScore()
+    lower, upper = sprtBounds(args.alpha, args.beta)
+    workers = args.workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    pgn = PGN.PGNWriter(args.pgn, "a") if args.pgn else None
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            # future -> (round number, True when engine1 has white)
+            futures = {pool.submit(playGame, fen, white, black): (number, white is engine1)
+                       for number, (fen, white, black) in enumerate(pairings, 1)}
+            for future in concurrent.futures.as_completed(futures):
+                game = future.result()
+                number, engine1White = futures[future]
+                gameScore = RESULT_SCORES[game["result"]]
+                score.add(gameScore if engine1White else 1 - gameScore)
+
+                if pgn is not None:
+                    tags = {"Event": "MatchRunner", "Site": "?", "Date": time.strftime("%Y.%m.%d"),
+                            "Round": number, "White": game["white"], "Black": game["black"],
+                            "Termination": game["termination"]}
+                    if game["fen"] != ChessEngine.START_FEN:
+                        tags["FEN"] = game["fen"]
+                    pgn.write(PGN.Game(tags, game["moves"], game["result"]))
+                    pgn.flush()
+
+                llr = score.llr(args.elo0, args.elo1)
+                elo = score.elo()
+                print("game %d/%d %s-%s %s (%s)  +%d =%d -%d  elo %s  llr %.2f [%.2f, %.2f]"
+                      % (score.games, len(pairings), game["white"], game["black"], game["result"],
+                         game["termination"], score.wins, score.draws, score.losses,
+                         "%+.1f +- %.1f" % elo if elo else "n/a", llr, lower, upper))
+                sys.stdout.flush()
+
+                if args.sprt and (llr <= lower or llr >= upper):
+                    print("\nSPRT accepted " + ("H1: %s is stronger" % engine1["name"] if llr >= upper
+                                                else "H0: %s is not stronger" % engine1["name"]))
+                    for other in futures:
+                        other.cancel()
+                    break
+    finally:
+        if pgn is not None:
+            pgn.close()
+
+    print("\n%s vs %s: +%d =%d -%d in %.1fs" % (engine1["name"], engine2["name"], score.wins, score.draws,
+                                                 score.losses, time.perf_counter() - start))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other")
+    parser.add_argument("--engine1", required=True, help="settings of the engine under test, e.g. name=new,time=0.1")
+    parser.add_argument("--engine2", required=True, help="settings of the reference engine")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="games played at once, one per core by default")
+    parser.add_argument("--openings", help="file with one opening FEN per line instead of the built in openings")
+    parser.add_argument("--pgn", help="append finished games to this PGN file, gzip compressed when it ends in .gz")
+    parser.add_argument("--sprt", action="store_true", help="stop once the SPRT accepts H0 or H1")
+    parser.add_argument("--elo0", type=float, default=0.0, help="Elo difference of the SPRT null hypothesis")
+    parser.add_argument("--elo1", type=float, default=5.0, help="Elo difference of the SPRT alternative hypothesis")
+    parser.add_argument("--alpha", type=float, default=0.05, help="SPRT false positive rate")
+    parser.add_argument("--beta", type=float, default=0.05, help="SPRT false negative rate")
+    args = parser.parse_args(argv)
+
+    openings = OPENINGS
+    if args.openings:
+        openings = readOpenings(args.openings)
+        # the pairings would never reach the number of games
+        if not openings:
+            parser.error("no opening FENs in " + args.openings)
+    return runMatch(args, openings)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Move ordering for Search. Alpha-beta prunes the most when the best move is tried first, so moves are tried in
+this order:
+
+1. the hash move from the transposition table
+2. captures and promotions, most valuable victim first and cheapest attacker breaking ties (MVV-LVA)
+3. killer moves, quiet moves that caused a cutoff at the same ply elsewhere in the tree
+4. the remaining quiet moves by history score, how often each from/to pair caused cutoffs so far
+
+Captures are generated before quiet moves, so when a capture refutes the position the quiet moves never get
+generated at all.
+"""
+
+import ChessEngine
+
+
+# MVV-LVA values, indexed by the piece letter
+ORDER_VALUES = {"p": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+
+KILLER_SLOTS = 2
+# history scores are halved once one of them passes this, so old cutoffs fade
+HISTORY_LIMIT = 1 << 20
+
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 24
+
+STAGE_HASH = 0
+STAGE_CAPTURES = 1
+STAGE_QUIETS = 2
+STAGE_DONE = 3
+
+
+"""MVV-LVA score of capturing victim with attacker, both piece strings like "bQ" """
+
+
+def captureScore(victim, attacker):
+    return ORDER_VALUES[victim[1]] * 8 - ORDER_VALUES[attacker[1]]
+
+
+"""Score of a move code in the current position, captures and promotions above every quiet move"""
+
+
+def codeCaptureScore(board, code):
+    start = code & 63
+    to = code >> 6 & 63
+    attacker = board[start >> 3][start & 7]
+    victim = board[to >> 3][to & 7]
+    kind = code & ChessEngine.CODE_KIND_MASK
+    score = CAPTURE_SCORE
+    if kind == ChessEngine.CODE_ENPASSANT:
+        score += captureScore("-p", attacker)
+    elif victim != ChessEngine.BLANK_SPACE:
+        score += captureScore(victim, attacker)
+    if kind == ChessEngine.CODE_PROMOTION:
+        score += ORDER_VALUES[ChessEngine.CODE_PROMOTION_PIECES[code >> 12 & 3]] * 8
+    return score
+
+
+class MoveOrderer():
+    def __init__(self, maxPly):
+        self.killers = [0] * (KILLER_SLOTS * (maxPly + 1))
+        # indexed by side to move * 4096 + from/to bits of the code
+        self.history = [0] * (2 * 4096)
+
+    """Forget killers and fade history between searches, the positions they came from are gone"""
+
+    def newSearch(self):
+        for index in range(len(self.killers)):
+            self.killers[index] = 0
+        for index in range(len(self.history)):
+            self.history[index] >>= 2
+
+    def isKiller(self, ply, code):
+        base = ply * KILLER_SLOTS
+        return self.killers[base] == code or self.killers[base + 1] == code
+
+    """Remembers a quiet move that caused a beta cutoff"""
+
+    def addCutoff(self, whiteToMove, ply, code, depth):
+        base = ply * KILLER_SLOTS
+        if self.killers[base] != code:
+            self.killers[base + 1] = self.killers[base]
+            self.killers[base] = code
+
+        index = whiteToMove * 4096 + (code & 0xFFF)
+        self.history[index] += depth * depth
+        if self.history[index] > HISTORY_LIMIT:
+            for i in range(len(self.history)):
+                self.history[i] >>= 1
+
+    def quietScore(self, whiteToMove, ply, code):
+        if self.isKiller(ply, code):
+            return KILLER_SCORE
+        return self.history[whiteToMove * 4096 + (code & 0xFFF)]
+
+
+"""
+Hands out the legal moves of one position in order, generating them in stages. Search keeps one picker per ply so
+the buffers are allocated once.
+"""
+
+
+class MovePicker():
+    def __init__(self, orderer):
+        self.orderer = orderer
+        self.buffer = ChessEngine.newMoveBuffer()
+        self.captures = None
+        self.quiets = None
+        self.index = 0
+        self.stage = STAGE_DONE
+        self.gs = None
+        self.hashMove = 0
+        self.ply = 0
+        self.lastQuiet = False
+
+    """Starts handing out the moves of gs, lastQuiet tells whether the move just returned was a quiet one"""
+
+    def start(self, gs, hashMove, ply):
+        self.gs = gs
+        self.hashMove = hashMove
+        self.ply = ply
+        self.captures = None
+        self.quiets = None
+        self.index = 0
+        self.stage = STAGE_HASH if hashMove else STAGE_CAPTURES
+
+    """Returns the next move code, or 0 when there are none left"""
+
+    def nextMove(self):
+        if self.stage == STAGE_HASH:
+            self.stage = STAGE_CAPTURES
+            # a table entry can come from a different position with a colliding key, only play it if it is legal here
+            start = self.hashMove & 63
+            board = self.gs.board
+            if board[start >> 3][start & 7][0] == ('w' if self.gs.whiteToMove else 'b'):
+                if codeCaptureScore(board, self.hashMove) > CAPTURE_SCORE:
+                    self.generateCaptures()
+                    self.lastQuiet = False
+                    legal = self.hashMove in self.captures
+                else:
+                    self.generateQuiets()
+                    self.lastQuiet = True
+                    legal = self.hashMove in self.quiets
+                if legal:
+                    return self.hashMove
+            self.hashMove = 0
+
+        if self.stage == STAGE_CAPTURES:
+            if self.captures is None:
+                self.generateCaptures()
+            while self.index < len(self.captures):
+                code = self.captures[self.index]
+                self.index += 1
+                if code != self.hashMove:
+                    self.lastQuiet = False
+                    return code
+            self.stage = STAGE_QUIETS
+            self.index = 0
+
+        if self.stage == STAGE_QUIETS:
+            if self.quiets is None:
+                self.generateQuiets()
+            while self.index < len(self.quiets):
+                code = self.quiets[self.index]
+                self.index += 1
+                if code != self.hashMove:
+                    self.lastQuiet = True
+                    return code
+            self.stage = STAGE_DONE
+
+        return 0
+
+    def generateCaptures(self):
+        count = self.gs.generateMoveCodes(self.buffer, ChessEngine.GENERATE_CAPTURES)
+        board = self.gs.board
+        self.captures = sorted(self.buffer[:count], key=lambda code: codeCaptureScore(board, code), reverse=True)
+
+    def generateQuiets(self):
+        count = self.gs.generateMoveCodes(self.buffer, ChessEngine.GENERATE_QUIETS)
+        whiteToMove = self.gs.whiteToMove
+        ply = self.ply
+        quietScore = self.orderer.quietScore
+        self.quiets = sorted(self.buffer[:count], key=lambda code: quietScore(whiteToMove, ply, code), reverse=True)
@@ -0,0 +1,113 @@
+"""
+Polyglot opening book (.bin) lookup.
+
+A Polyglot book is a sorted array of 16 byte big endian entries: position key, move, weight and a learn field. The
+keys are the same Zobrist keys GameState keeps (see Zobrist), so a lookup is a binary search for gs.zobristKey. The
+file is memory mapped rather than read, so opening a book costs nothing and every process using the same book
+shares the operating system's cached pages.
+
+Polyglot moves put the destination file in bits 0-2, its rank (0 is rank 1) in bits 3-5, the start file and rank in
+bits 6-11 and the promotion piece (1 knight to 4 queen) in bits 12-14. Castling is written as the king taking its
+own rook.
+"""
+
+import mmap
+import os
+import random
+import struct
+
+import ChessEngine
+
+
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+
+POLYGLOT_PROMOTIONS = (None, "N", "B", "R", "Q")
+
+# king move as Polyglot writes castling -> the move GameState generates
+CASTLING_MOVES = {"e1h1": "e1g1", "e1a1": "e1c1", "e8h8": "e8g8", "e8a8": "e8c8"}
+
+
+"""Coordinate notation ("e7e8q") of a Polyglot move, castling still written as the king taking the rook"""
+
+
+def polyglotNotation(move):
+    notation = ""
+    for square in (move >> 6 & 63, move & 63):
+        notation += "abcdefgh"[square & 7] + str((square >> 3) + 1)
+    promotion = POLYGLOT_PROMOTIONS[move >> 12 & 7]
+    if promotion is not None:
+        notation += promotion.lower()
+    return notation
+
+
+class OpeningBook():
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            # an empty file can't be mapped, it is a book without entries
+            if os.fstat(file.fileno()).st_size:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b""
+        self.count = len(self.data) // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """(Polyglot move, weight) of every entry for key, in file order"""
+
+    def entries(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        index = low
+        while index < self.count:
+            entryKey, move, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entryKey != key:
+                break
+            found.append((move, weight))
+            index += 1
+        return found
+
+    """
+    A book move for gs as a Move from gs.getValidMoves(), or None when the book has none. Picks the heaviest move,
+    or a move at random in proportion to the weights with weighted. Entries that are not legal here are ignored.
+    """
+
+    def probe(self, gs, weighted=False, rng=random):
+        entries = self.entries(gs.zobristKey)
+        if not entries:
+            return None
+
+        legal = {move.getChessNotation(): move for move in gs.getValidMoves()}
+        candidates = []
+        for move, weight in entries:
+            notation = polyglotNotation(move)
+            notation = CASTLING_MOVES.get(notation, notation) if self.isKingMove(gs, notation) else notation
+            if notation in legal:
+                candidates.append((legal[notation], weight))
+        if not candidates:
+            return None
+
+        if weighted and sum(weight for _, weight in candidates) > 0:
+            return rng.choices([move for move, _ in candidates], [weight for _, weight in candidates])[0]
+        return max(candidates, key=lambda candidate: candidate[1])[0]
+
+    def isKingMove(self, gs, notation):
+        row = ChessEngine.Move.ranksToRows[notation[1]]
+        col = ChessEngine.Move.filesToCols[notation[0]]
+        return gs.board[row][col][1] == "K"
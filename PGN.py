@@ -0,0 +1,386 @@
+"""
+PGN (Portable Game Notation) reading and writing, with moves in standard algebraic notation (SAN).
+
+readGames is a generator that reads one game at a time, so archives of any size (plain or gzip) stream through in
+the memory of a single game. Game.replay plays a game's moves into a GameState. Every SAN is checked against the
+legal moves unless the input is trusted, then the moving piece is found from the attack tables and the legal moves
+are only generated when two pieces could make the move. PGNWriter streams games out the same way.
+
+    for game in PGN.readGames(PGN.openPGN("archive.pgn.gz")):
+        gs = game.replay(trusted=True)
+"""
+
+import gzip
+import re
+
+import AttackTables
+import Bitboards
+import ChessEngine
+
+
+# the Seven Tag Roster every PGN game starts with, in this order
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+
+MOVETEXT_WIDTH = 80
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+GZIP_MAGIC = b"\x1f\x8b"
+
+TAG_PAIR = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# a whole comment, the start of one that goes on in the next lines, a rest of line comment, variation brackets,
+# numeric annotation glyphs, move numbers and everything else (moves and results)
+MOVETEXT_TOKEN = re.compile(r"\{[^}]*\}|\{.*|;.*|[()]|\$\d+|\d+\.+|[^\s(){};$]+")
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+"""
+SAN of move in gs before it is played, like "Nbd7", "exd6", "e8=Q+" or "O-O#". legalMoves are gs.getValidMoves()
+when the caller already has them. gs is left as it was found.
+"""
+
+
+def moveToSAN(gs, move, legalMoves=None):
+    if legalMoves is None:
+        legalMoves = gs.getValidMoves()
+
+    if move.castle:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        target = move.getRankFile(move.endRow, move.endCol)
+        capture = move.pieceCaptured != ChessEngine.BLANK_SPACE
+        piece = move.pieceMoved[1]
+        if piece == "p":
+            san = (move.colsToFiles[move.startCol] + "x" if capture else "") + target
+            if move.pawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            san = piece + disambiguation(move, legalMoves) + ("x" if capture else "") + target
+
+    gs.makeMove(move)
+    if gs.inCheck():
+        san += "#" if not gs.getValidMoves() else "+"
+    gs.undoMove()
+    return san
+
+
+"""The file, rank or square of the start square that tells move apart from other moves of the same piece type"""
+
+
+def disambiguation(move, legalMoves):
+    others = [other for other in legalMoves if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow
+              and other.endCol == move.endCol and (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+    if not others:
+        return ""
+    if all(other.startCol != move.startCol for other in others):
+        return move.colsToFiles[move.startCol]
+    if all(other.startRow != move.startRow for other in others):
+        return move.rowsToRanks[move.startRow]
+    return move.getRankFile(move.startRow, move.startCol)
+
+
+"""Movetext for a list of SAN moves from a position with the given side to move and fullmove number"""
+
+
+def movetext(sanMoves, result, whiteToMove=True, fullmoveNumber=1):
+    tokens = []
+    for san in sanMoves:
+        if whiteToMove:
+            tokens.append(str(fullmoveNumber) + ".")
+        elif not tokens:
+            tokens.append(str(fullmoveNumber) + "...")
+        tokens.append(san)
+        if not whiteToMove:
+            fullmoveNumber += 1
+        whiteToMove = not whiteToMove
+    tokens.append(result)
+
+    lines = []
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > MOVETEXT_WIDTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines)
+
+
+"""
+One game as PGN text, ending in a blank line. tags is a dict, missing roster tags are filled with "?". Games that
+don't start from the initial position need a "FEN" tag, whose side to move and move number the movetext follows.
+"""
+
+
+def gameToPGN(tags, sanMoves, result):
+    tags = dict(tags)
+    tags["Result"] = result
+    lines = ['[%s "%s"]' % (name, escapeTag(tags.pop(name, "?"))) for name in SEVEN_TAG_ROSTER]
+    if "FEN" in tags:
+        tags.setdefault("SetUp", "1")
+    lines += ['[%s "%s"]' % (name, escapeTag(str(value))) for name, value in tags.items()]
+
+    whiteToMove = True
+    fullmoveNumber = 1
+    if "FEN" in tags:
+        fields = tags["FEN"].split()
+        whiteToMove = fields[1] == "w"
+        fullmoveNumber = int(fields[5]) if len(fields) == 6 else 1
+    return "\n".join(lines) + "\n\n" + movetext(sanMoves, result, whiteToMove, fullmoveNumber) + "\n\n"
+
+
+def escapeTag(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+"""
+Opens a PGN file for reading ("r") or writing ("w", "a") as text. Reading recognises gzip by its magic bytes, writing
+compresses when the name ends in .gz.
+"""
+
+
+def openPGN(path, mode="r"):
+    if mode == "r":
+        with open(path, "rb") as file:
+            compressed = file.read(2) == GZIP_MAGIC
+    else:
+        compressed = path.endswith(".gz")
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8", errors="replace", newline="")
+    return open(path, mode, encoding="utf-8", errors="replace", newline="")
+
+
+class Game():
+    def __init__(self, tags=None, moves=None, result="*"):
+        self.tags = tags if tags is not None else {}
+        # SAN strings
+        self.moves = moves if moves is not None else []
+        self.result = result
+
+    @property
+    def startFEN(self):
+        return self.tags.get("FEN", ChessEngine.START_FEN)
+
+    """
+    Plays the moves into a new GameState from the game's start position and returns it, gs.moveLog holds the game.
+    trusted skips the legality check of moves that only one piece can make. Raises ValueError at the first move that
+    can't be played.
+    """
+
+    def replay(self, trusted=False, backend="list"):
+        gs = ChessEngine.GameState.fromFEN(self.startFEN, backend)
+        for san in self.moves:
+            try:
+                move = parseTrustedSAN(gs, san) if trusted else parseSAN(gs, san)
+            except ValueError as error:
+                number = gs.fullmoveNumber
+                raise ValueError("move %d%s %s: %s" % (number, "." if gs.whiteToMove else "...", san, error)) from None
+            gs.makeMove(move)
+        return gs
+
+    def toPGN(self):
+        return gameToPGN(self.tags, self.moves, self.result)
+
+
+"""Game record of gs played from startFEN, SAN is generated by replaying gs.moveLog"""
+
+
+def gameFromState(gs, tags=None, result="*", startFEN=ChessEngine.START_FEN):
+    replay = ChessEngine.GameState.fromFEN(startFEN)
+    moves = []
+    for move in gs.moveLog:
+        moves.append(moveToSAN(replay, move))
+        replay.makeMove(move)
+
+    tags = dict(tags or {})
+    if startFEN != ChessEngine.START_FEN:
+        tags["FEN"] = startFEN
+    return Game(tags, moves, result)
+
+
+"""
+Yields the games of a PGN text file one at a time. Comments, variations and annotation glyphs are dropped, only the
+main line is kept.
+"""
+
+
+def readGames(file):
+    game = None
+    inMovetext = False
+    commentOpen = False
+    # nesting of the variation being skipped, 0 on the main line
+    variation = 0
+
+    for line in file:
+        if commentOpen:
+            end = line.find("}")
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            commentOpen = False
+        elif line.startswith("%"):
+            continue
+
+        stripped = line.strip()
+        if stripped.startswith("[") and not variation:
+            match = TAG_PAIR.match(stripped)
+            if match:
+                # tags after movetext start the next game, even when the last one had no result
+                if game is None or inMovetext:
+                    if game is not None:
+                        yield game
+                    game = Game()
+                    inMovetext = False
+                game.tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+                continue
+
+        for token in MOVETEXT_TOKEN.findall(line):
+            first = token[0]
+            if first == "{":
+                commentOpen = not token.endswith("}")
+                continue
+            if first in ";$" or first.isdigit() and token.endswith("."):
+                continue
+            if first == "(":
+                variation += 1
+                continue
+            if first == ")":
+                variation = max(variation - 1, 0)
+                continue
+            if variation:
+                continue
+
+            if game is None:
+                game = Game()
+            inMovetext = True
+            if token in RESULTS:
+                game.result = token
+                yield game
+                game = None
+                inMovetext = False
+            else:
+                game.moves.append(token.rstrip("!?"))
+
+    if game is not None and (game.moves or game.tags):
+        yield game
+
+
+"""Writes games to a file as they come, opened with openPGN when given a path"""
+
+
+class PGNWriter():
+    def __init__(self, file, mode="w"):
+        self.ownsFile = isinstance(file, str)
+        self.file = openPGN(file, mode) if self.ownsFile else file
+
+    def write(self, game):
+        self.file.write(game.toPGN())
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.ownsFile:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+"""(piece letter, start file or None, start rank or None, target square, promotion letter or None) of a SAN move"""
+
+
+def splitSAN(san):
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        return "K", None, None, None, san.count("-") == 1 and "g" or "c"
+    match = SAN_PATTERN.match(san)
+    if not match:
+        raise ValueError("not a SAN move")
+    piece, fromFile, fromRank, target, promotion = match.groups()
+    return piece or "p", fromFile, fromRank, target, promotion
+
+
+def sanMatches(move, piece, fromFile, fromRank, row, col, promotion):
+    return (move.pieceMoved[1] == piece and move.endRow == row and move.endCol == col and
+            (fromFile is None or move.colsToFiles[move.startCol] == fromFile) and
+            (fromRank is None or move.rowsToRanks[move.startRow] == fromRank) and
+            move.promotionChoice == (promotion or ("Q" if move.pawnPromotion else None)))
+
+
+"""Target (row, col) of a SAN move, castling moves go to the king's destination"""
+
+
+def sanTarget(gs, target, promotion):
+    if target is None:
+        # castling, promotion holds the destination file
+        return (7 if gs.whiteToMove else 0), ChessEngine.Move.filesToCols[promotion]
+    return ChessEngine.Move.ranksToRows[target[1]], ChessEngine.Move.filesToCols[target[0]]
+
+
+"""The legal move san stands for in gs, ValueError when it is illegal or ambiguous"""
+
+
+def parseSAN(gs, san, legalMoves=None):
+    piece, fromFile, fromRank, target, promotion = splitSAN(san)
+    row, col = sanTarget(gs, target, promotion)
+    if target is None:
+        promotion = None
+    if legalMoves is None:
+        legalMoves = gs.getValidMoves()
+
+    matches = [move for move in legalMoves if sanMatches(move, piece, fromFile, fromRank, row, col, promotion)]
+    if len(matches) != 1:
+        raise ValueError("illegal move" if not matches else "ambiguous move")
+    if target is None and not matches[0].castle:
+        raise ValueError("illegal move")
+    return matches[0]
+
+
+"""
+Like parseSAN for input known to be legal: the start square comes from the attack tables, and the legal moves are
+only generated when more than one piece of the kind can reach the target (one of them may be pinned)
+"""
+
+
+def parseTrustedSAN(gs, san):
+    piece, fromFile, fromRank, target, promotion = splitSAN(san)
+    row, col = sanTarget(gs, target, promotion)
+    color = gs.whiteToMove and "w" or "b"
+    board = gs.board
+    if target is None:
+        start = ((7 if gs.whiteToMove else 0), 4)
+        return ChessEngine.Move(start, (row, col), board)
+
+    square = row * 8 + col
+    bitboards, occupancy = gs.getPositionBitboards()
+    offset = 0 if gs.whiteToMove else 6
+    enpassant = False
+    if piece == "p":
+        forward = 1 if gs.whiteToMove else -1
+        if fromFile is not None and fromFile != target[0]:
+            starts = [(row + forward, ChessEngine.Move.filesToCols[fromFile])]
+            enpassant = board[row][col] == ChessEngine.BLANK_SPACE
+        elif board[row + forward][col] == color + "p":
+            starts = [(row + forward, col)]
+        else:
+            starts = [(row + 2 * forward, col)]
+    else:
+        occupied = occupancy[Bitboards.BOTH]
+        reach = {"N": AttackTables.KNIGHT_ATTACKS[square], "B": AttackTables.bishopAttacks(square, occupied),
+                 "R": AttackTables.rookAttacks(square, occupied), "Q": AttackTables.queenAttacks(square, occupied),
+                 "K": AttackTables.KING_ATTACKS[square]}[piece]
+        starts = [divmod(start, 8) for start in Bitboards.iterSquares(reach & bitboards[offset +
+                                                                                          "pNBRQK".index(piece)])]
+        starts = [(startRow, startCol) for startRow, startCol in starts
+                  if (fromFile is None or ChessEngine.Move.colsToFiles[startCol] == fromFile) and
+                  (fromRank is None or ChessEngine.Move.rowsToRanks[startRow] == fromRank)]
+        if len(starts) > 1:
+            return parseSAN(gs, san)
+
+    if len(starts) != 1 or board[starts[0][0]][starts[0][1]] != color + piece:
+        raise ValueError("no piece can make this move")
+    return ChessEngine.Move(starts[0], (row, col), board, enpassant=enpassant, promotionChoice=promotion or "Q")
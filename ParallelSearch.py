@@ -0,0 +1,258 @@
+"""
+Root splitting search over a pool of worker processes, so a search is not limited to the one core CPython gives it.
+
+The first SERIAL_DEPTH depths are searched in the main process with a plain Search.Searcher, they take too little
+time to pay for the round trip to a worker and they put the best root move first. Every deeper depth of the iterative
+deepening is searched like this: the first root move (the best one from the previous depth) is searched with a full window to get a score to beat, then every other root move is searched in parallel
+with a null window around that score, which only tells whether the move is better. Moves that turn out better are
+searched again in parallel with an open window for their exact score. Every worker process keeps its own
+Search.Searcher and transposition table for the whole session, so the next depth and the next search start warm.
+
+Results are merged in root move order rather than the order the workers finish in: the highest score wins and the
+earlier root move wins a tie, so the same worker results always give the same move.
+
+    python ParallelSearch.py --workers 4 --depth 5
+"""
+
+import argparse
+import concurrent.futures
+import os
+import pickle
+import sys
+import time
+
+import ChessEngine
+import Perft
+import Search
+import TranspositionTable
+
+
+# how long the main process waits between checks of stop() while workers search
+POLL_SECONDS = 0.05
+# depths searched in the main process before the workers take over
+SERIAL_DEPTH = 2
+
+
+# per process state of a worker, set up by initWorker
+workerSearcher = None
+workerSearchId = None
+workerGame = None
+
+
+def initWorker(ttSizeMB):
+    global workerSearcher
+    workerSearcher = Search.Searcher(TranspositionTable.TranspositionTable(ttSizeMB))
+
+
+"""
+Runs in a worker: searches one root move of the game pickled in gameData and returns (code, score, pv, nodes), or
+None when the deadline passed or the search needed more than maxNodes nodes. The deadline is in time.time() seconds since the clock has to mean the same in every
+process, and a task waiting in the queue must not get a fresh budget when it starts. The game is only unpickled once
+per search id.
+"""
+
+
+def searchRootMoveTask(searchId, gameData, code, depth, alpha, beta, deadline, maxNodes):
+    global workerSearchId, workerGame
+    if searchId != workerSearchId:
+        workerSearchId = searchId
+        workerGame = pickle.loads(gameData)
+        workerSearcher.newSearch()
+
+    timeLimit = None
+    if deadline is not None:
+        timeLimit = deadline - time.time()
+        if timeLimit <= 0:
+            return None
+    result = workerSearcher.searchRootMove(workerGame, code, depth, alpha, beta, timeLimit, maxNodes)
+    if result is None:
+        return None
+    score, pv = result
+    return code, score, pv, workerSearcher.nodes
+
+
+class ParallelSearcher():
+    """workers defaults to one per core, each worker process gets a transposition table of ttSizeMB"""
+
+    def __init__(self, workers=None, ttSizeMB=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=initWorker,
+                                                           initargs=(ttSizeMB,))
+        # searches the first SERIAL_DEPTH depths
+        self.searcher = Search.Searcher(TranspositionTable.TranspositionTable(ttSizeMB))
+        self.searchId = 0
+        self.nodes = 0
+        self.deadline = None
+        self.maxNodes = None
+        self.stopped = False
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """
+    Asks a running search to return the best move of the last finished depth. Root moves the workers already started
+    keep running in the background until they finish or hit the time limit.
+    """
+
+    def stop(self):
+        self.stopped = True
+        self.searcher.stop()
+
+    """
+    Searches gs and returns a Search.SearchResult, limited by maxDepth, timeLimit (seconds) and maxNodes like
+    Search.Searcher.search. onIteration, if given, is called with the SearchResult of every finished depth.
+
+    The node limit is shared by all workers: the root moves of a batch may each use what is left of it, and a depth
+    whose moves used more than that in total is thrown away. The workers can search up to one batch past maxNodes.
+    """
+
+    def search(self, gs, maxDepth=Search.MAX_PLY, timeLimit=None, maxNodes=None, onIteration=None):
+        start = time.perf_counter()
+        self.searchId += 1
+        self.stopped = False
+        # time.time() based, see searchRootMoveTask
+        self.deadline = time.time() + timeLimit if timeLimit is not None else None
+        self.maxNodes = maxNodes
+
+        result = self.searcher.search(gs, min(maxDepth, SERIAL_DEPTH), timeLimit, maxNodes, onIteration)
+        self.nodes = result.nodes
+        if result.depth < min(maxDepth, SERIAL_DEPTH) or result.depth == maxDepth or self.stopped or \
+                Search.isMateScore(result.score):
+            return result
+        if timeLimit is not None and time.perf_counter() - start > timeLimit / 2:
+            return result
+
+        buffer = ChessEngine.newMoveBuffer()
+        rootMoves = list(buffer[:gs.generateMoveCodes(buffer)])
+        rootMoves.remove(result.pv[0])
+        rootMoves.insert(0, result.pv[0])
+        gameData = pickle.dumps(gs)
+
+        for depth in range(SERIAL_DEPTH + 1, min(maxDepth, Search.MAX_PLY) + 1):
+            best = self.searchDepth(gameData, rootMoves, depth)
+            if best is None:
+                break
+
+            score, pv = best
+            # the best move goes first at the next depth, the rest keep their order
+            rootMoves.remove(pv[0])
+            rootMoves.insert(0, pv[0])
+            result = Search.SearchResult(ChessEngine.Move.fromCode(pv[0], gs.board), score, depth, self.nodes,
+                                         time.perf_counter() - start, pv)
+            if onIteration is not None:
+                onIteration(result)
+
+            if Search.isMateScore(score):
+                break
+            # the next depth takes several times as long as this one, don't start what can't finish
+            if timeLimit is not None and time.perf_counter() - start > timeLimit / 2:
+                break
+        return result
+
+    """Searches every root move to depth and returns (score, pv) of the best, or None when the search was cut short"""
+
+    def searchDepth(self, gameData, rootMoves, depth):
+        first = self.runTasks(gameData, rootMoves[:1], depth, -Search.INFINITY, Search.INFINITY)
+        if first is None:
+            return None
+        alpha = first[0][1]
+
+        # (score, root move index, pv) of every move that is at least as good as the first
+        candidates = [(alpha, 0, first[0][2])]
+        scouts = self.runTasks(gameData, rootMoves[1:], depth, alpha, alpha + 1)
+        if scouts is None:
+            return None
+        better = [code for code, score, _ in scouts if score > alpha]
+        if better:
+            exact = self.runTasks(gameData, better, depth, alpha, Search.INFINITY)
+            if exact is None:
+                return None
+            for code, score, pv in exact:
+                # a fail high the open window does not confirm is search instability, the first move stays ahead
+                if score > alpha:
+                    candidates.append((score, rootMoves.index(code), pv))
+
+        score, _, pv = max(candidates, key=lambda candidate: (candidate[0], -candidate[1]))
+        return score, pv
+
+    """
+    Searches codes in parallel and returns [(code, score, pv)] in the order of codes, or None when the time or the
+    nodes ran out or stop() was called before all of them finished
+    """
+
+    def runTasks(self, gameData, codes, depth, alpha, beta):
+        if self.deadline is not None and time.time() >= self.deadline:
+            return None
+        nodesLeft = None
+        if self.maxNodes is not None:
+            nodesLeft = self.maxNodes - self.nodes
+            if nodesLeft <= 0:
+                return None
+
+        futures = [self.pool.submit(searchRootMoveTask, self.searchId, gameData, code, depth, alpha, beta,
+                                    self.deadline, nodesLeft) for code in codes]
+        pending = set(futures)
+        while pending:
+            if self.stopped or (self.deadline is not None and time.time() >= self.deadline):
+                break
+            _, pending = concurrent.futures.wait(pending, timeout=POLL_SECONDS)
+
+        results = []
+        for future in futures:
+            if not future.done() or future.result() is None:
+                for other in futures:
+                    other.cancel()
+                return None
+            code, score, pv, nodes = future.result()
+            self.nodes += nodes
+            results.append((code, score, pv))
+        if self.maxNodes is not None and self.nodes > self.maxNodes:
+            return None
+        return results
+
+
+"""Searches every reference position to depth with one process and with the pool, and prints the speedup"""
+
+
+def runBenchmark(args):
+    positions = [(name, fen) for name, (fen, _) in Perft.REFERENCE_POSITIONS.items()]
+    print("%-10s %9s %9s %8s  %s" % ("position", "serial", "parallel", "speedup", "moves"))
+
+    serialTotal = 0.0
+    parallelTotal = 0.0
+    with ParallelSearcher(args.workers, args.hash) as parallel:
+        for name, fen in positions:
+            gs = ChessEngine.GameState.fromFEN(fen)
+            serial = Search.Searcher(TranspositionTable.TranspositionTable(args.hash))
+            serialResult = serial.search(gs, args.depth)
+            parallelResult = parallel.search(gs, args.depth)
+
+            serialTotal += serialResult.seconds
+            parallelTotal += parallelResult.seconds
+            speedup = serialResult.seconds / parallelResult.seconds if parallelResult.seconds > 0 else 0
+            moves = serialResult.bestMove.getChessNotation() + " " + parallelResult.bestMove.getChessNotation()
+            print("%-10s %8.3fs %8.3fs %7.2fx  %s" % (name, serialResult.seconds, parallelResult.seconds, speedup,
+                                                      moves))
+
+    speedup = serialTotal / parallelTotal if parallelTotal > 0 else 0
+    print("\ntotal      %8.3fs %8.3fs %7.2fx with %d workers to depth %d"
+          % (serialTotal, parallelTotal, speedup, parallel.workers, args.depth))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the parallel root splitting search with a single process")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per core by default")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size per process in MB")
+    return runBenchmark(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
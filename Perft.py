@@ -0,0 +1,219 @@
+"""
+Perft counts the leaf nodes of the legal move tree to a fixed depth. The counts for well known positions are
+published, so any difference points at a move generation bug, and the time taken measures generation speed.
+
+    python Perft.py perft --depth 4 --divide
+    python Perft.py perft --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1" --depth 5
+    python Perft.py suite --depth 3
+    python Perft.py bench --depth 3 --output bench.json --compare previous_bench.json
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import ChessEngine
+
+
+START_FEN = ChessEngine.START_FEN
+
+# name -> (fen, node counts for depth 1, 2, 3, ...)
+REFERENCE_POSITIONS = {
+    "start": (START_FEN, [20, 400, 8902, 197281, 4865609]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4085603]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  [46, 2079, 89890, 3894594]),
+}
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+"""Perft split by root move, returns a list of (move notation, nodes)"""
+
+
+def divide(gs, depth):
+    results = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        results.append((move.getChessNotation(), perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+
+"""Runs perft and returns (nodes, seconds)"""
+
+
+def timedPerft(fen, depth, backend):
+    gs = ChessEngine.GameState.fromFEN(fen, backend)
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    seconds = time.perf_counter() - start
+    return nodes, seconds
+
+
+def nodesPerSecond(nodes, seconds):
+    return int(nodes / seconds) if seconds > 0 else 0
+
+
+def runPerft(args):
+    gs = ChessEngine.GameState.fromFEN(args.fen, args.backend)
+    start = time.perf_counter()
+    if args.divide:
+        results = divide(gs, args.depth)
+        for notation, nodes in results:
+            print(notation + ": " + str(nodes))
+        nodes = sum(count for _, count in results)
+        print("\nMoves: " + str(len(results)))
+    else:
+        nodes = perft(gs, args.depth)
+    seconds = time.perf_counter() - start
+
+    print("Nodes: " + str(nodes))
+    print("Time: %.3fs, %d nodes per second" % (seconds, nodesPerSecond(nodes, seconds)))
+    return 0
+
+
+"""Checks every reference position up to depth against the published counts"""
+
+
+def runSuite(args):
+    failures = 0
+    for name, (fen, counts) in REFERENCE_POSITIONS.items():
+        for depth in range(1, min(args.depth, len(counts)) + 1):
+            nodes, seconds = timedPerft(fen, depth, args.backend)
+            status = "ok" if nodes == counts[depth - 1] else "FAIL expected " + str(counts[depth - 1])
+            if nodes != counts[depth - 1]:
+                failures += 1
+            print("%-10s depth %d: %10d nodes %8.3fs %8d nps  %s"
+                  % (name, depth, nodes, seconds, nodesPerSecond(nodes, seconds), status))
+
+    print("\n" + ("all positions passed" if failures == 0 else str(failures) + " failures"))
+    return 1 if failures else 0
+
+
+def currentRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+"""
+Times every reference position at depth and optionally writes the results to a JSON file and compares them with
+a file written by an earlier run. Node counts that differ from the reference count as failures, positions that got
+slower by more than the tolerance are reported as regressions.
+"""
+
+
+def runBench(args):
+    results = {
+        "revision": currentRevision(),
+        "backend": args.backend,
+        "depth": args.depth,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "positions": {},
+    }
+
+    failures = 0
+    totalNodes = 0
+    totalSeconds = 0.0
+    for name, (fen, counts) in REFERENCE_POSITIONS.items():
+        depth = min(args.depth, len(counts))
+        nodes, seconds = timedPerft(fen, depth, args.backend)
+        if nodes != counts[depth - 1]:
+            failures += 1
+            print("%s: expected %d nodes at depth %d, got %d" % (name, counts[depth - 1], depth, nodes))
+        results["positions"][name] = {"depth": depth, "nodes": nodes, "seconds": seconds,
+                                      "nps": nodesPerSecond(nodes, seconds)}
+        totalNodes += nodes
+        totalSeconds += seconds
+        print("%-10s depth %d: %10d nodes %8.3fs %8d nps" % (name, depth, nodes, seconds, nodesPerSecond(nodes, seconds)))
+
+    results["nodes"] = totalNodes
+    results["seconds"] = totalSeconds
+    results["nps"] = nodesPerSecond(totalNodes, totalSeconds)
+    print("\ntotal: %d nodes %.3fs %d nps" % (totalNodes, totalSeconds, results["nps"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+        regressions = compareBench(previous, results, args.tolerance)
+
+    return 1 if failures or regressions else 0
+
+
+def compareBench(previous, current, tolerance):
+    print("\ncompared with revision %s (%s backend):" % (previous.get("revision"), previous.get("backend")))
+    regressions = 0
+    for name, result in current["positions"].items():
+        old = previous["positions"].get(name)
+        if old is None or old["depth"] != result["depth"] or not old["nps"]:
+            print("%-10s no comparable result" % name)
+            continue
+
+        change = result["nps"] / old["nps"] - 1
+        flag = ""
+        if change < -tolerance:
+            flag = "  REGRESSION"
+            regressions += 1
+        print("%-10s %8d -> %8d nps  %+6.1f%%%s" % (name, old["nps"], result["nps"], change * 100, flag))
+
+    if previous.get("nps"):
+        print("%-10s %8d -> %8d nps  %+6.1f%%" % ("total", previous["nps"], current["nps"],
+                                                 (current["nps"] / previous["nps"] - 1) * 100))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft correctness checks and move generation benchmarks")
+    parser.add_argument("--backend", choices=ChessEngine.BACKENDS, default="list")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    perftParser = commands.add_parser("perft", help="count nodes from one position")
+    perftParser.add_argument("--fen", default=START_FEN)
+    perftParser.add_argument("--depth", type=int, default=3)
+    perftParser.add_argument("--divide", action="store_true", help="print the node count below every root move")
+
+    suiteParser = commands.add_parser("suite", help="check the reference positions against their known counts")
+    suiteParser.add_argument("--depth", type=int, default=3, help="deepest depth to check")
+
+    benchParser = commands.add_parser("bench", help="time the reference positions")
+    benchParser.add_argument("--depth", type=int, default=3)
+    benchParser.add_argument("--output", help="write the results to this JSON file")
+    benchParser.add_argument("--compare", help="JSON file from an earlier bench run to compare with")
+    benchParser.add_argument("--tolerance", type=float, default=0.05,
+                             help="fraction of nodes per second a position may lose before it counts as a regression")
+
+    args = parser.parse_args(argv)
+    commands = {"perft": runPerft, "suite": runSuite, "bench": runBench}
+    return commands[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
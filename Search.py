@@ -0,0 +1,320 @@
+"""
+Alpha-beta search over GameState.
+
+Negamax with iterative deepening: depth 1, 2, 3, ... is searched until the depth, node or time budget runs out, and
+the move from the last finished depth is played. The time limit is a hard deadline, a search that runs over it is
+abandoned and its position unwound, so a bot never takes longer than its budget. Leaves are resolved with a
+quiescence search over captures so the evaluation is never taken in the middle of an exchange.
+"""
+
+import time
+
+import ChessEngine
+import Evaluation
+import MoveOrdering
+import TranspositionTable
+
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+
+# how many nodes pass between clock checks, minus one
+CHECK_INTERVAL = 1023
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class SearchResult():
+    def __init__(self, bestMove, score, depth, nodes, seconds, pv, hashfull=0):
+        self.bestMove = bestMove
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.nps = int(nodes / seconds) if seconds > 0 else 0
+        # principal variation as move codes, starting with the best move
+        self.pv = pv
+        # permille of the transposition table used by this search
+        self.hashfull = hashfull
+
+    def pvNotation(self):
+        return " ".join(ChessEngine.codeNotation(code) for code in self.pv)
+
+
+def isMateScore(score):
+    return abs(score) >= MATE_SCORE - MAX_PLY
+
+
+"""
+Mate scores count plies from the root, the table stores them counted from the position itself so an entry is
+right wherever in the tree the position turns up again
+"""
+
+
+def scoreToTable(score, ply):
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+
+class Searcher():
+    """
+    Pass a TranspositionTable to share or size it, the table is kept between searches. With an
+    OpeningBook.OpeningBook or a Tablebase.Tablebase, positions they know are answered from them without searching.
+    """
+
+    def __init__(self, transpositionTable=None, book=None, tablebase=None):
+        if transpositionTable is None:
+            transpositionTable = TranspositionTable.TranspositionTable()
+        self.tt = transpositionTable
+        self.book = book
+        self.tablebase = tablebase
+        self.buffers = [ChessEngine.newMoveBuffer() for _ in range(MAX_PLY + 1)]
+        self.orderer = MoveOrdering.MoveOrderer(MAX_PLY)
+        self.pickers = [MoveOrdering.MovePicker(self.orderer) for _ in range(MAX_PLY + 1)]
+        self.pvTable = [[] for _ in range(MAX_PLY + 1)]
+        self.previousPV = []
+        self.nodes = 0
+        self.deadline = None
+        self.maxNodes = None
+        self.stopped = False
+
+    """Asks a running search to return the best move found so far, safe to call from another thread"""
+
+    def stop(self):
+        self.stopped = True
+
+    """
+    Searches gs and returns a SearchResult. Any of maxDepth, timeLimit (seconds) and maxNodes limit the search.
+    onIteration, if given, is called with the SearchResult of every finished depth. gs is left as it was found.
+    """
+
+    def search(self, gs, maxDepth=MAX_PLY, timeLimit=None, maxNodes=None, onIteration=None):
+        start = time.perf_counter()
+        known = self.knownResult(gs, start)
+        if known is not None:
+            return known
+
+        self.newSearch()
+        self.setLimits(start, timeLimit, maxNodes)
+        rootPly = len(gs.moveLog)
+
+        result = None
+        for depth in range(1, min(maxDepth, MAX_PLY) + 1):
+            try:
+                score = self.negamax(gs, depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                while len(gs.moveLog) > rootPly:
+                    gs.undoMove()
+                break
+
+            pv = list(self.pvTable[0])
+            if not pv:
+                # no legal moves at the root
+                break
+            self.previousPV = pv
+            result = SearchResult(ChessEngine.Move.fromCode(pv[0], gs.board), score, depth, self.nodes,
+                                  time.perf_counter() - start, pv, self.tt.hashfull())
+            if onIteration is not None:
+                onIteration(result)
+
+            if isMateScore(score):
+                break
+            # the next depth takes several times as long as this one, don't start what can't finish
+            if self.deadline is not None and time.perf_counter() - start > (self.deadline - start) / 2:
+                break
+
+        if result is None:
+            result = self.fallbackResult(gs, start)
+        return result
+
+    """A depth 0 SearchResult from the opening book or the tablebase, or None when neither knows the position"""
+
+    def knownResult(self, gs, start):
+        if self.book is not None:
+            move = self.book.probe(gs)
+            if move is not None:
+                return SearchResult(move, 0, 0, 0, time.perf_counter() - start, [move.code])
+        if self.tablebase is not None:
+            hit = self.tablebase.bestMove(gs)
+            if hit is not None:
+                move, score = hit
+                return SearchResult(move, score, 0, 0, time.perf_counter() - start, [move.code])
+        return None
+
+    """Forgets what only applied to the previous root position, the transposition table entries stay useful"""
+
+    def newSearch(self):
+        self.previousPV = []
+        self.tt.newSearch()
+        self.orderer.newSearch()
+
+    def setLimits(self, start, timeLimit, maxNodes):
+        self.nodes = 0
+        self.stopped = False
+        self.maxNodes = maxNodes
+        self.deadline = start + timeLimit if timeLimit is not None else None
+
+    """
+    Searches the single root move code of gs to depth with the window alpha..beta and returns (score, pv) from the
+    point of view of the side to move in gs, or None when a limit ran out first. For callers that split the root
+    moves between several searchers, call newSearch before the first move of each new root position.
+    """
+
+    def searchRootMove(self, gs, code, depth, alpha=-INFINITY, beta=INFINITY, timeLimit=None, maxNodes=None):
+        self.setLimits(time.perf_counter(), timeLimit, maxNodes)
+        rootPly = len(gs.moveLog)
+        try:
+            gs.makeMove(ChessEngine.Move.fromCode(code, gs.board))
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, 1)
+        except SearchAborted:
+            while len(gs.moveLog) > rootPly:
+                gs.undoMove()
+            return None
+        gs.undoMove()
+        return score, [code] + self.pvTable[1]
+
+    """Used when the budget ran out before depth 1 finished, plays any legal move"""
+
+    def fallbackResult(self, gs, start):
+        buffer = self.buffers[0]
+        count = gs.generateMoveCodes(buffer)
+        seconds = time.perf_counter() - start
+        if count == 0:
+            return SearchResult(None, 0, 0, self.nodes, seconds, [])
+        return SearchResult(ChessEngine.Move.fromCode(buffer[0], gs.board), 0, 0, self.nodes, seconds, [buffer[0]])
+
+    def checkLimits(self):
+        if self.stopped:
+            raise SearchAborted()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchAborted()
+        if self.maxNodes is not None and self.nodes >= self.maxNodes:
+            raise SearchAborted()
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & CHECK_INTERVAL == 0:
+            self.checkLimits()
+
+        self.pvTable[ply] = []
+        if ply > 0 and (gs.halfmoveClock >= 100 or gs.repetitions()):
+            return 0
+        if ply >= MAX_PLY:
+            return Evaluation.evaluate(gs)
+
+        key = gs.zobrist
+        hashMove = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            hashMove, entryDepth, bound, entryScore = entry
+            entryScore = scoreFromTable(entryScore, ply)
+            # the root always searches so it has a move and a principal variation to report
+            if ply > 0 and entryDepth >= depth:
+                if bound == TranspositionTable.BOUND_EXACT or \
+                        (bound == TranspositionTable.BOUND_LOWER and entryScore >= beta) or \
+                        (bound == TranspositionTable.BOUND_UPPER and entryScore <= alpha):
+                    return entryScore
+
+        inCheck = gs.inCheck()
+        # in check there is no standing pat, keep searching all evasions
+        if depth <= 0 and not inCheck:
+            return self.quiescence(gs, alpha, beta, ply)
+
+        # try the move the table remembers first, else follow the principal variation of the previous iteration
+        if not hashMove and ply < len(self.previousPV):
+            hashMove = self.previousPV[ply]
+        picker = self.pickers[ply]
+        picker.start(gs, hashMove, ply)
+
+        originalAlpha = alpha
+        best = -INFINITY
+        bestMove = 0
+        moveCount = 0
+        code = picker.nextMove()
+        while code:
+            moveCount += 1
+            gs.makeMove(ChessEngine.Move.fromCode(code, gs.board))
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMove()
+
+            if score > best:
+                best = score
+                bestMove = code
+            if score > alpha:
+                alpha = score
+                self.pvTable[ply] = [code] + self.pvTable[ply + 1]
+                if alpha >= beta:
+                    self.recordCutoff(gs, ply, code, depth, picker.lastQuiet)
+                    break
+            code = picker.nextMove()
+
+        if moveCount == 0:
+            return -MATE_SCORE + ply if inCheck else 0
+
+        if best >= beta:
+            bound = TranspositionTable.BOUND_LOWER
+        elif best > originalAlpha:
+            bound = TranspositionTable.BOUND_EXACT
+        else:
+            bound = TranspositionTable.BOUND_UPPER
+            # no move raised alpha, so none of them is known to be best
+            bestMove = 0
+        self.tt.store(key, bestMove, depth, bound, scoreToTable(best, ply))
+        return best
+
+    """Called at every beta cutoff of negamax's move loop, quiet moves that cut off train the move ordering"""
+
+    def recordCutoff(self, gs, ply, code, depth, quiet):
+        if quiet:
+            self.orderer.addCutoff(gs.whiteToMove, ply, code, depth)
+
+    def quiescence(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & CHECK_INTERVAL == 0:
+            self.checkLimits()
+
+        standPat = Evaluation.evaluate(gs)
+        if standPat >= beta or ply >= MAX_PLY:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+
+        buffer = self.buffers[ply]
+        count = gs.generateMoveCodes(buffer, ChessEngine.GENERATE_CAPTURES)
+        board = gs.board
+        captures = sorted(buffer[:count], key=lambda code: MoveOrdering.codeCaptureScore(board, code), reverse=True)
+
+        best = standPat
+        for code in captures:
+            gs.makeMove(ChessEngine.Move.fromCode(code, board))
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undoMove()
+
+            if score > best:
+                best = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return best
+
+
+"""Searches gs with a fresh Searcher and transposition table, see Searcher.search"""
+
+
+def search(gs, maxDepth=MAX_PLY, timeLimit=None, maxNodes=None, onIteration=None):
+    return Searcher().search(gs, maxDepth, timeLimit, maxNodes, onIteration)
@@ -0,0 +1,223 @@
+"""
+Endgame tables for king and queen or king and rook against a bare king, generated locally by retrograde analysis:
+
+    python Tablebase.py --output tables
+
+A table holds one byte per position: 0 when the strong side can't force mate (a draw or an impossible position),
+else the distance to mate in plies plus one. Positions are indexed by side to move (0 the side with the extra piece,
+1 the bare king), strong king square, piece square and weak king square, with squares numbered like Bitboards.
+Without pawns or castling the colors make no difference, so one table serves both.
+
+Tables are memory mapped on first use, so probing needs no loading step and processes share the cached pages.
+"""
+
+import argparse
+import collections
+import mmap
+import os
+import sys
+import time
+
+import AttackTables
+import Bitboards
+import ChessEngine
+import Search
+
+
+# table name -> piece letter of the strong side's extra piece
+TABLES = {"KQvK": "Q", "KRvK": "R"}
+TABLE_SIZE = 2 * 64 * 64 * 64
+
+STRONG_TO_MOVE = 0
+WEAK_TO_MOVE = 1
+
+
+def tableIndex(sideToMove, strongKing, piece, weakKing):
+    return sideToMove << 18 | strongKing << 12 | piece << 6 | weakKing
+
+
+def pieceAttacks(letter, square, occupied):
+    if letter == "Q":
+        return AttackTables.queenAttacks(square, occupied)
+    return AttackTables.rookAttacks(square, occupied)
+
+
+"""
+Builds the table for the piece letter. Mates are found first, then every solved position solves its predecessors
+in order of distance: a position with the strong side to move is won as soon as one move reaches a won position,
+one with the weak side to move once every move does. The last of those moves gives the longest defence, so
+processing by distance gives exact distances.
+"""
+
+
+def generateTable(letter):
+    table = bytearray(TABLE_SIZE)
+    # moves of weak to move positions that don't reach a won position yet
+    remaining = {}
+    solved = collections.deque()
+    KING = AttackTables.KING_ATTACKS
+
+    def strongLegal(strongKing, piece, weakKing):
+        # with the strong side to move the weak king must not be in check
+        occupied = 1 << strongKing | 1 << piece | 1 << weakKing
+        return not pieceAttacks(letter, piece, occupied) >> weakKing & 1
+
+    for strongKing in range(64):
+        for piece in range(64):
+            if piece == strongKing:
+                continue
+            for weakKing in range(64):
+                if weakKing in (strongKing, piece) or KING[strongKing] >> weakKing & 1:
+                    continue
+
+                # weak king moves from here, the king itself doesn't block the piece's attacks
+                occupied = 1 << strongKing | 1 << piece
+                attacked = KING[strongKing] | pieceAttacks(letter, piece, occupied)
+                moves = 0
+                for target in Bitboards.iterSquares(KING[weakKing]):
+                    if target == piece:
+                        # taking the piece draws, unless the king defends it
+                        if not KING[strongKing] >> piece & 1:
+                            moves += 1
+                    elif not attacked >> target & 1:
+                        moves += 1
+
+                index = tableIndex(WEAK_TO_MOVE, strongKing, piece, weakKing)
+                if moves:
+                    remaining[index] = moves
+                elif pieceAttacks(letter, piece, occupied | 1 << weakKing) >> weakKing & 1:
+                    table[index] = 1
+                    solved.append((WEAK_TO_MOVE, strongKing, piece, weakKing, 0))
+
+    while solved:
+        sideToMove, strongKing, piece, weakKing, distance = solved.popleft()
+        occupied = 1 << strongKing | 1 << piece | 1 << weakKing
+
+        if sideToMove == WEAK_TO_MOVE:
+            # strong side moves that lead here, each wins in one more ply
+            predecessors = [(fromSquare, piece) for fromSquare in Bitboards.iterSquares(KING[strongKing] & ~occupied)
+                            if not KING[fromSquare] >> weakKing & 1]
+            predecessors += [(strongKing, fromSquare)
+                             for fromSquare in Bitboards.iterSquares(pieceAttacks(letter, piece, occupied) & ~occupied)]
+            for fromKing, fromPiece in predecessors:
+                index = tableIndex(STRONG_TO_MOVE, fromKing, fromPiece, weakKing)
+                if not table[index] and strongLegal(fromKing, fromPiece, weakKing):
+                    table[index] = distance + 2
+                    solved.append((STRONG_TO_MOVE, fromKing, fromPiece, weakKing, distance + 1))
+        else:
+            # weak king moves that lead here, the position is lost once none of its moves escape
+            for fromSquare in Bitboards.iterSquares(KING[weakKing] & ~occupied & ~KING[strongKing]):
+                index = tableIndex(WEAK_TO_MOVE, strongKing, piece, fromSquare)
+                if table[index] or index not in remaining:
+                    continue
+                remaining[index] -= 1
+                if not remaining[index]:
+                    table[index] = distance + 2
+                    solved.append((WEAK_TO_MOVE, strongKing, piece, fromSquare, distance + 1))
+    return table
+
+
+class Tablebase():
+    """directory holds the KQvK.tb style files written by generateTable, missing tables are just never hit"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+    def table(self, name):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + ".tb")
+            table = None
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(table) != TABLE_SIZE:
+                    table.close()
+                    raise ValueError(path + " is not a table, expected " + str(TABLE_SIZE) + " bytes")
+            self.tables[name] = table
+        return self.tables[name]
+
+    """
+    Score of gs for the side to move in Search's units (mate scores count plies), or None when no table covers it
+    """
+
+    def probeScore(self, gs):
+        pieces = [(piece, row * 8 + col) for row, pieces in enumerate(gs.board) for col, piece in enumerate(pieces)
+                  if piece != ChessEngine.BLANK_SPACE]
+        extra = [(piece, square) for piece, square in pieces if piece[1] != "K"]
+        if not extra:
+            return 0
+        if len(extra) != 1 or len(pieces) != 3:
+            return None
+
+        (strongPiece, piece), = extra
+        name = "K" + strongPiece[1] + "vK"
+        if name not in TABLES:
+            return None
+        table = self.table(name)
+        if table is None:
+            return None
+
+        strongColor = strongPiece[0]
+        strongKing = next(square for p, square in pieces if p == strongColor + "K")
+        weakKing = next(square for p, square in pieces if p[1] == "K" and p[0] != strongColor)
+        strongToMove = gs.whiteToMove == (strongColor == "w")
+
+        value = table[tableIndex(STRONG_TO_MOVE if strongToMove else WEAK_TO_MOVE, strongKing, piece, weakKing)]
+        if not value:
+            return 0
+        score = Search.MATE_SCORE - (value - 1)
+        return score if strongToMove else -score
+
+    """(Move, score) of the best move for the side to move in gs, or None when no table covers the position"""
+
+    def bestMove(self, gs):
+        if self.probeScore(gs) is None:
+            return None
+
+        best = None
+        for move in gs.getValidMoves():
+            gs.makeMove(move)
+            score = self.probeScore(gs)
+            gs.undoMove()
+            if score is None:
+                return None
+            # one ply further from the mate than the position after the move
+            score = -score
+            if score > 0:
+                score -= 1
+            elif score < 0:
+                score += 1
+            if best is None or score > best[1]:
+                best = (move, score)
+        return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the endgame tables")
+    parser.add_argument("--output", default="tables", help="directory to write the tables to")
+    parser.add_argument("tables", nargs="*", help="tables to generate out of " + ", ".join(TABLES) + ", all by default")
+    args = parser.parse_args(argv)
+    for name in args.tables:
+        if name not in TABLES:
+            parser.error("unknown table " + repr(name))
+
+    os.makedirs(args.output, exist_ok=True)
+    for name in args.tables or TABLES:
+        start = time.perf_counter()
+        table = generateTable(TABLES[name])
+        with open(os.path.join(args.output, name + ".tb"), "wb") as file:
+            file.write(table)
+        print("%s: %d won positions, longest mate %d plies, %.1fs" % (name, sum(1 for value in table if value),
+                                                                     max(table) - 1, time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Training data for evaluation networks: positions turned into fixed layout numpy arrays, written in shards that are
+memory mapped back for training.
+
+Every position becomes a 12x64 uint8 plane array, one plane per piece in Bitboards.PIECES order and squares numbered
+like Bitboards (0 is a8), plus a META_DTYPE record with the side to move, castling rights, en passant square, move
+counters, the game result and the static evaluation. Positions are collected in GameState's packed format, which
+toPacked builds with a handful of bytes operations per position, and converted to arrays a shard at a time with numpy.
+Lines and games that can't be read are skipped and reported to stderr, like BatchRunner does.
+
+A shard is a pair of .npy files, <name>.planes.npy and <name>.meta.npy. iterBatches memory maps them and yields
+minibatches as views into the mapped files, so loading copies nothing:
+
+    python TrainingData.py games.pgn.gz --output data
+    for planes, meta in TrainingData.iterBatches("data", 1024, shuffle=True):
+        ...
+"""
+
+import argparse
+import contextlib
+import glob
+import math
+import os
+import random
+import sys
+import time
+
+import ChessEngine
+import Evaluation
+import PGN
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+PLANES = len(ChessEngine.PACKED_PIECES) - 1
+SHARD_SIZE = 65536
+RESULT_LABELS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+if numpy is not None:
+    # result is from white's point of view, NaN when unknown. score is Evaluation's, also from white's point of view.
+    META_DTYPE = numpy.dtype([("whiteToMove", numpy.uint8), ("castling", numpy.uint8, 4), ("enpassant", numpy.int8),
+                              ("halfmoveClock", numpy.uint16), ("fullmoveNumber", numpy.uint16),
+                              ("result", numpy.float32), ("score", numpy.int16)])
+    PLANE_CODES = numpy.arange(1, PLANES + 1, dtype=numpy.uint8).reshape(1, PLANES, 1)
+
+
+def requireNumpy():
+    if numpy is None:
+        raise ImportError("TrainingData needs numpy")
+
+
+"""
+Converts packed positions (the records joined into one bytes-like object) and their results to (planes, meta)
+arrays, with the static evaluation filled in
+"""
+
+
+def packedToArrays(positions, results):
+    requireNumpy()
+    records = numpy.frombuffer(positions, dtype=numpy.uint8).reshape(-1, ChessEngine.PACKED_SIZE)
+    count = len(records)
+
+    # two squares per byte, the lower square in the low nibble, code 0 is an empty square
+    codes = numpy.empty((count, 64), dtype=numpy.uint8)
+    codes[:, 0::2] = records[:, :32] & 0xF
+    codes[:, 1::2] = records[:, :32] >> 4
+    planes = (codes.reshape(count, 1, 64) == PLANE_CODES).view(numpy.uint8)
+
+    meta = numpy.zeros(count, dtype=META_DTYPE)
+    flags = records[:, 32]
+    meta["whiteToMove"] = flags & 1
+    for right in range(4):
+        meta["castling"][:, right] = flags >> (right + 1) & 1
+    enpassant = records[:, 33].astype(numpy.int16)
+    enpassant[enpassant == ChessEngine.NO_ENPASSANT] = -1
+    meta["enpassant"] = enpassant
+    meta["halfmoveClock"] = records[:, 34:36].copy().view("<u2").ravel()
+    meta["fullmoveNumber"] = records[:, 36:38].copy().view("<u2").ravel()
+    meta["result"] = results
+    meta["score"] = Evaluation.evaluatePacked(positions)
+    return planes, meta
+
+
+class ShardWriter():
+    """
+    Collects positions and writes them to directory as shardSize position shards. Only the positions of the shard
+    being filled are held in memory, in packed form.
+    """
+
+    def __init__(self, directory, shardSize=SHARD_SIZE, prefix="shard"):
+        requireNumpy()
+        self.directory = directory
+        self.shardSize = shardSize
+        self.prefix = prefix
+        self.positions = []
+        self.results = []
+        self.shards = len(glob.glob(os.path.join(directory, prefix + "-*.meta.npy")))
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    """Adds gs, or a position GameState.toPacked already packed, with the game's result from white's point of view"""
+
+    def add(self, position, result=math.nan):
+        if isinstance(position, ChessEngine.GameState):
+            position = position.toPacked()
+        self.positions.append(position)
+        self.results.append(result)
+        if len(self.positions) >= self.shardSize:
+            self.flush()
+
+    def flush(self):
+        if not self.positions:
+            return
+        planes, meta = packedToArrays(b"".join(self.positions), numpy.array(self.results, dtype=numpy.float32))
+        name = os.path.join(self.directory, "%s-%05d" % (self.prefix, self.shards))
+        # meta goes last, a shard without one is an interrupted write and is not loaded
+        numpy.save(name + ".planes.npy", planes)
+        numpy.save(name + ".meta.npy", meta)
+        self.shards += 1
+        self.written += len(self.positions)
+        self.positions = []
+        self.results = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+"""
+Yields (packed position, result) for every position of every game, before each move is played. A game whose start
+FEN can't be read is skipped with a line to errors, None to skip it silently.
+"""
+
+
+def gamePositions(games, trusted=True, errors=sys.stderr):
+    for number, game in enumerate(games, 1):
+        result = RESULT_LABELS.get(game.result, math.nan)
+        try:
+            gs = ChessEngine.GameState.fromFEN(game.startFEN)
+        except (ValueError, KeyError, IndexError) as error:
+            reportSkipped(errors, "game %d" % number, error)
+            continue
+        for san in game.moves:
+            try:
+                move = PGN.parseTrustedSAN(gs, san) if trusted else PGN.parseSAN(gs, san)
+            except ValueError:
+                # the rest of a broken game can't be trusted
+                break
+            yield gs.toPacked(), result
+            gs.makeMove(move)
+
+
+"""
+Yields (packed position, result) for FEN lines, optionally followed by a tab and a result like 1-0 or 0.5. A line
+with a bad FEN or result is skipped with a line to errors, None to skip it silently.
+"""
+
+
+def fenPositions(lines, errors=sys.stderr):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fen, _, label = line.partition("\t")
+        label = label.strip()
+        try:
+            if label in RESULT_LABELS:
+                result = RESULT_LABELS[label]
+            elif label and label != "*":
+                result = float(label)
+            else:
+                result = math.nan
+            position = ChessEngine.GameState.fromFEN(fen).toPacked()
+        except (ValueError, KeyError, IndexError) as error:
+            reportSkipped(errors, "line %d" % number, error)
+            continue
+        yield position, result
+
+
+def reportSkipped(errors, where, error):
+    if errors is not None:
+        errors.write("%s skipped, error: %s\n" % (where, error))
+
+
+"""(planes, meta) memory maps of every complete shard in directory, in name order"""
+
+
+def loadShards(directory, prefix="shard"):
+    requireNumpy()
+    shards = []
+    for metaPath in sorted(glob.glob(os.path.join(directory, prefix + "-*.meta.npy"))):
+        planesPath = metaPath[:-len(".meta.npy")] + ".planes.npy"
+        shards.append((numpy.load(planesPath, mmap_mode="r"), numpy.load(metaPath, mmap_mode="r")))
+    return shards
+
+
+"""
+Yields (planes, meta) minibatches of batchSize positions as views into the memory mapped shards. Batches don't span
+shards, so the last one of a shard may be smaller unless dropLast. With shuffle the shards and the batches within
+them come in random order, each batch is still a contiguous slice so nothing is copied.
+"""
+
+
+def iterBatches(directory, batchSize, shuffle=False, dropLast=False, rng=random, prefix="shard"):
+    shards = loadShards(directory, prefix)
+    batches = []
+    for index, (planes, meta) in enumerate(shards):
+        for start in range(0, len(meta), batchSize):
+            if dropLast and start + batchSize > len(meta):
+                break
+            batches.append((index, start))
+
+    if shuffle:
+        rng.shuffle(batches)
+    for index, start in batches:
+        planes, meta = shards[index]
+        yield planes[start:start + batchSize], meta[start:start + batchSize]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export positions as numpy training data shards")
+    parser.add_argument("input", help="PGN file (plain or gzip) or a file of FEN lines, - for FEN lines on stdin")
+    parser.add_argument("--output", default="data", help="directory to write the shards to")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="positions per shard")
+    parser.add_argument("--format", choices=("pgn", "fen"), help="input format, from the file name by default")
+    parser.add_argument("--validate", action="store_true", help="check every PGN move for legality")
+    args = parser.parse_args(argv)
+    if numpy is None:
+        parser.error("TrainingData needs numpy")
+
+    inputFormat = args.format
+    if inputFormat is None:
+        inputFormat = "pgn" if args.input.endswith((".pgn", ".pgn.gz")) else "fen"
+
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if args.input == "-":
+            source = sys.stdin
+        elif inputFormat == "pgn":
+            source = stack.enter_context(PGN.openPGN(args.input))
+        else:
+            source = stack.enter_context(open(args.input))
+        writer = stack.enter_context(ShardWriter(args.output, args.shard_size))
+
+        if inputFormat == "pgn":
+            positions = gamePositions(PGN.readGames(source), trusted=not args.validate)
+        else:
+            positions = fenPositions(source)
+        for position, result in positions:
+            writer.add(position, result)
+
+    print("%d positions in %d shards, %.1fs" % (writer.written, writer.shards, time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Fixed size transposition table for Search, keyed by GameState.zobristKey.
+
+Entries live in two preallocated arrays of 64 bit integers, one for keys and one for the packed data, so the table
+takes the same memory from creation until it is dropped however long a bot session runs. Each bucket has two
+slots: the first keeps the deepest result (replaced only by an equal or deeper search, or once it is from an older
+search), the second takes whatever the first one would not.
+
+Packed data layout: move code in bits 0-15, depth in bits 16-23, bound in bits 24-25, generation in bits 26-31 and
+the score plus SCORE_OFFSET in bits 32-63. Data 0 marks an empty slot, every stored entry has a non zero bound.
+"""
+
+import array
+
+
+BOUND_EXACT = 1
+# the score is at least this much (the search failed high)
+BOUND_LOWER = 2
+# the score is at most this much (the search failed low)
+BOUND_UPPER = 3
+
+ENTRY_BYTES = 16
+SLOTS_PER_BUCKET = 2
+SCORE_OFFSET = 1 << 31
+GENERATIONS = 64
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        # largest power of two number of buckets that fits the budget, so the bucket index is a mask of the key
+        buckets = max(1, (sizeMB * 1024 * 1024) // (ENTRY_BYTES * SLOTS_PER_BUCKET))
+        self.bucketCount = 1 << (buckets.bit_length() - 1)
+        self.mask = self.bucketCount - 1
+
+        slots = self.bucketCount * SLOTS_PER_BUCKET
+        self.keys = array.array("Q", bytes(8 * slots))
+        self.data = array.array("Q", bytes(8 * slots))
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    """Memory taken by the entries, in bytes"""
+
+    def sizeBytes(self):
+        return len(self.keys) * self.keys.itemsize + len(self.data) * self.data.itemsize
+
+    """Call before each new search so entries from earlier searches get replaced first"""
+
+    def newSearch(self):
+        self.generation = (self.generation + 1) % GENERATIONS
+
+    def clear(self):
+        slots = len(self.keys)
+        self.keys = array.array("Q", bytes(8 * slots))
+        self.data = array.array("Q", bytes(8 * slots))
+        self.generation = 0
+        self.resetCounters()
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    """Returns (move code, depth, bound, score) for the position, or None"""
+
+    def probe(self, key):
+        slot = (key & self.mask) * SLOTS_PER_BUCKET
+        keys = self.keys
+        for index in (slot, slot + 1):
+            if keys[index] == key:
+                data = self.data[index]
+                if data:
+                    self.hits += 1
+                    return (data & 0xFFFF, data >> 16 & 0xFF, data >> 24 & 3,
+                            (data >> 32) - SCORE_OFFSET)
+
+        self.misses += 1
+        # the bucket is full of other positions
+        if self.data[slot] and self.data[slot + 1]:
+            self.collisions += 1
+        return None
+
+    def store(self, key, move, depth, bound, score):
+        self.stores += 1
+        slot = (key & self.mask) * SLOTS_PER_BUCKET
+        packed = (move | max(0, min(depth, 255)) << 16 | bound << 24 | self.generation << 26 |
+                  (score + SCORE_OFFSET) << 32)
+
+        current = self.data[slot]
+        if not current or self.keys[slot] == key or depth >= (current >> 16 & 0xFF) or \
+                (current >> 26 & 0x3F) != self.generation:
+            # keep the old move when the new search found none, it is still the best guess for ordering
+            if self.keys[slot] == key and not move:
+                packed |= current & 0xFFFF
+            self.keys[slot] = key
+            self.data[slot] = packed
+        else:
+            self.keys[slot + 1] = key
+            self.data[slot + 1] = packed
+
+    """Permille of sampled slots holding an entry from the current search, as UCI reports it"""
+
+    def hashfull(self, sample=1000):
+        sample = min(sample, len(self.data))
+        used = 0
+        for index in range(sample):
+            data = self.data[index]
+            if data and (data >> 26 & 0x3F) == self.generation:
+                used += 1
+        return used * 1000 // sample
@@ -0,0 +1,239 @@
+"""
+UCI (Universal Chess Interface) front end, so tournament managers and match scripts can run the engine without a
+display:
+
+    python UCI.py
+
+The main thread only reads commands, searches run on their own thread and print info lines as every depth finishes,
+so stop, isready and quit are answered while a search runs. Supported commands: uci, isready, ucinewgame,
+setoption name Hash|BookFile|TablebasePath value <MB or path>, position startpos|fen <fen> [moves ...],
+go [depth n] [nodes n] [movetime ms] [wtime ms] [btime ms] [winc ms] [binc ms] [movestogo n] [infinite], stop and
+quit.
+"""
+
+import sys
+import threading
+
+import ChessEngine
+import OpeningBook
+import Search
+import Tablebase
+import TranspositionTable
+
+
+ENGINE_NAME = "ChessEngine"
+ENGINE_AUTHOR = "ChessEngine authors"
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+
+# moves the rest of the game is assumed to take when the GUI doesn't send movestogo
+DEFAULT_MOVES_TO_GO = 30
+# milliseconds kept back from every move for the time it takes the answer to reach the GUI
+MOVE_OVERHEAD_MS = 50
+
+STOP_POLL_SECONDS = 0.01
+
+
+"""UCI score string, mates are counted in moves with a negative count when the engine is the one getting mated"""
+
+
+def scoreString(score):
+    if Search.isMateScore(score):
+        plies = Search.MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return "mate " + str(moves if score > 0 else -moves)
+    return "cp " + str(score)
+
+
+def infoLine(result):
+    return "info depth %d score %s nodes %d nps %d time %d hashfull %d pv %s" % (
+        result.depth, scoreString(result.score), result.nodes, result.nps, int(result.seconds * 1000),
+        result.hashfull, result.pvNotation())
+
+
+"""Seconds to spend on the next move from the clock fields of a go command, or None to search without a clock"""
+
+
+def timeBudget(options, whiteToMove):
+    if "movetime" in options:
+        return max(options["movetime"] - MOVE_OVERHEAD_MS, 1) / 1000
+    remaining = options.get("wtime" if whiteToMove else "btime")
+    if remaining is None:
+        return None
+
+    increment = options.get("winc" if whiteToMove else "binc", 0)
+    movesToGo = options.get("movestogo", DEFAULT_MOVES_TO_GO)
+    budget = remaining / max(movesToGo, 1) + increment * 3 // 4
+    # never plan to use more than what is left on the clock
+    budget = min(budget, remaining - MOVE_OVERHEAD_MS)
+    return max(budget, 1) / 1000
+
+
+class UCIEngine():
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.searcher = Search.Searcher(TranspositionTable.TranspositionTable(DEFAULT_HASH_MB))
+        self.gs = ChessEngine.GameState()
+        self.searchThread = None
+        # set by stop, an infinite search must not answer before it
+        self.stopEvent = threading.Event()
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    """Handles one command line, returns False once the engine should quit"""
+
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max %d" % (DEFAULT_HASH_MB, MAX_HASH_MB))
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.searcher.tt.clear()
+            self.gs = ChessEngine.GameState()
+        elif command == "setoption":
+            self.setOption(args)
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(args)
+        elif command == "go":
+            self.stopSearch()
+            self.go(args)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        else:
+            self.send("info string unknown command " + command)
+        return True
+
+    def setOption(self, args):
+        text = " ".join(args)
+        if " value " not in text or not text.startswith("name "):
+            return
+        name, value = text[len("name "):].split(" value ", 1)
+        name = name.strip().lower()
+        value = value.strip()
+        self.stopSearch()
+        if name == "hash":
+            try:
+                sizeMB = min(max(int(value), 1), MAX_HASH_MB)
+            except ValueError:
+                self.send("info string Hash needs a number of MB, got " + value)
+                return
+            self.searcher.tt = TranspositionTable.TranspositionTable(sizeMB)
+        elif name == "bookfile":
+            if self.searcher.book is not None:
+                self.searcher.book.close()
+            self.searcher.book = None
+            if value and value != "<empty>":
+                try:
+                    self.searcher.book = OpeningBook.OpeningBook(value)
+                except OSError as error:
+                    self.send("info string cannot open book: " + str(error))
+        elif name == "tablebasepath":
+            if self.searcher.tablebase is not None:
+                self.searcher.tablebase.close()
+            self.searcher.tablebase = Tablebase.Tablebase(value) if value and value != "<empty>" else None
+
+    def setPosition(self, args):
+        if "moves" in args:
+            split = args.index("moves")
+            setup, moves = args[:split], args[split + 1:]
+        else:
+            setup, moves = args, []
+
+        if setup[:1] == ["startpos"]:
+            gs = ChessEngine.GameState.fromFEN(ChessEngine.START_FEN)
+        elif setup[:1] == ["fen"]:
+            try:
+                gs = ChessEngine.GameState.fromFEN(" ".join(setup[1:]))
+            except (ValueError, KeyError, IndexError) as error:
+                self.send("info string " + str(error))
+                return
+        else:
+            self.send("info string position needs startpos or fen")
+            return
+
+        for notation in moves:
+            legal = {move.getChessNotation(): move for move in gs.getValidMoves()}
+            if notation not in legal:
+                self.send("info string illegal move " + notation)
+                break
+            gs.makeMove(legal[notation])
+        self.gs = gs
+
+    def go(self, args):
+        options = {}
+        for index, token in enumerate(args):
+            if token in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo") and \
+                    index + 1 < len(args):
+                try:
+                    options[token] = int(args[index + 1])
+                except ValueError:
+                    self.send("info string " + token + " needs a number, got " + args[index + 1])
+                    return
+        infinite = "infinite" in args or "ponder" in args
+
+        maxDepth = options.get("depth", Search.MAX_PLY)
+        maxNodes = options.get("nodes")
+        timeLimit = None if infinite else timeBudget(options, self.gs.whiteToMove)
+
+        self.stopEvent.clear()
+        self.searchThread = threading.Thread(target=self.search, args=(self.gs, maxDepth, timeLimit, maxNodes,
+                                                                       infinite), daemon=True)
+        self.searchThread.start()
+
+    def search(self, gs, maxDepth, timeLimit, maxNodes, infinite):
+        result = self.searcher.search(gs, maxDepth, timeLimit, maxNodes,
+                                      onIteration=lambda iteration: self.send(infoLine(iteration)))
+        if infinite:
+            self.stopEvent.wait()
+
+        if result.bestMove is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send("bestmove " + result.bestMove.getChessNotation() + " ponder " +
+                      ChessEngine.codeNotation(result.pv[1]))
+        else:
+            self.send("bestmove " + result.bestMove.getChessNotation())
+
+    """Stops a running search and waits for its bestmove to be sent"""
+
+    def stopSearch(self):
+        if self.searchThread is None:
+            return
+        self.stopEvent.set()
+        # a search that has only just started resets its stop flag, so keep asking until the thread is done
+        while self.searchThread.is_alive():
+            self.searcher.stop()
+            self.searchThread.join(STOP_POLL_SECONDS)
+        self.searchThread = None
+
+
+def main():
+    engine = UCIEngine(sys.stdout)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
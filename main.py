@@ -1,7 +1,11 @@
 # Handles user input and displaying current game state
 
+import time
+
 import pygame as p
 import ChessEngine
+import EngineWorker
+import PGN
 
 width = height = 512
 dimension = 8
@@ -11,6 +15,14 @@ squareSize = height// dimension
 maxFPS = 15 # for animations
 IMAGES = {}
 
+# "w" or "b" for the side the engine plays, None for two human players
+engineColor = "b"
+engineSeconds = 2.0
+# let the engine think on the player's time
+ponder = True
+# S appends the game played so far to this PGN file
+gamesFile = "games.pgn"
+
 
 """
 Initialize a global dictionary of images. Called once
@@ -29,7 +41,6 @@ def main():
     p.init()
     screen = p.display.set_mode((width, height))
     clock = p.time.Clock()
-    screen.fill(p.Color("white"))
     gs = ChessEngine.GameState()
     validMoves = gs.getValidMoves()
     print(validMoves[0])
@@ -37,10 +48,20 @@ def main():
 
 
     loadImages()
+    boardSurface = renderBoard()
+    # square -> (piece, selected) as it is on screen, squares that no longer match are redrawn
+    shown = {}
     running = True
     squareSelected = ()
     playerClicks = []
 
+    # the engine searches on its own thread, the loop below only polls it so the window keeps responding
+    engine = EngineWorker.EngineWorker() if engineColor is not None else None
+    expectedReply = None
+    engineMoved = False
+    if engine is not None and enginesTurn(gs):
+        engine.requestSearch(gs, timeLimit=engineSeconds)
+
     print("Game Start")
 
     while running:
@@ -48,8 +69,12 @@ def main():
             if e.type == p.QUIT:
                 running = False
 
+            # the window was covered or restored, what it shows can't be trusted any more
+            elif e.type in (p.VIDEOEXPOSE, p.WINDOWEXPOSED):
+                shown.clear()
+
             # mouse handler
-            elif e.type == p.MOUSEBUTTONDOWN: # could add functionality to drag and drop
+            elif e.type == p.MOUSEBUTTONDOWN and not enginesTurn(gs): # could add functionality to drag and drop
                 location = p.mouse.get_pos() # col, row
                 col = location[0]//squareSize
                 row = location[1]//squareSize
@@ -62,7 +87,8 @@ def main():
                 if len(playerClicks) == 2:
                     move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
                     if move in validMoves:
-                        gs.makeMove(move)
+                        # play the generated move, it knows about en passant and castling. Promotions default to a queen
+                        gs.makeMove(validMoves[validMoves.index(move)])
                         moveMade = True
 
                     # reset user clicks
@@ -72,54 +98,120 @@ def main():
             # key handler
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_LEFT:
+                    if engine is not None:
+                        engine.cancel()
+                        expectedReply = None
                     gs.undoMove()
+                    # take back the engine's reply too, so it is the player's turn again
+                    if enginesTurn(gs):
+                        gs.undoMove()
                     moveMade = True
+                elif e.key == p.K_SPACE and engine is not None:
+                    # play the best move found so far
+                    engine.stop()
+                elif e.key == p.K_s:
+                    saveGame(gs, validMoves)
+                    print("Saved the game to " + gamesFile)
+
+        if engine is not None:
+            result = engine.poll()
+            if result is not None and result.bestMove is not None and enginesTurn(gs):
+                gs.makeMove(result.bestMove)
+                # the engine's principal variation says what it expects the player to answer
+                expectedReply = result.pv[1] if len(result.pv) > 1 else None
+                moveMade = True
+                engineMoved = True
 
         if moveMade:
             validMoves = gs.getValidMoves()
             moveMade = False
 
+            if engine is not None and validMoves:
+                if enginesTurn(gs):
+                    engine.requestSearch(gs, timeLimit=engineSeconds)
+                elif engineMoved and ponder and expectedReply is not None:
+                    engine.requestPonder(gs, ChessEngine.Move.fromCode(expectedReply, gs.board))
+            engineMoved = False
+
             if gs.whiteToMove:
                 print("White's turn")
             else:
                 print("Black's turn")
 
 
+        dirty = drawGameState(screen, boardSurface, gs, playerClicks, shown)
+        # frames where nothing changed leave the display alone
+        if dirty:
+            p.display.update(dirty)
         clock.tick(maxFPS)
-        p.display.flip()
 
-        drawGameState(screen, gs, playerClicks)
+    if engine is not None:
+        engine.close()
 
 
 """
-Responsible for graphics
+Appends the game to gamesFile as PGN, with the result once it is decided
 """
-def drawGameState(screen, gs, playerClicks):
-    drawBoard(screen, playerClicks)
-    drawPieces(screen, gs.board)
+def saveGame(gs, validMoves):
+    result = "*"
+    if not validMoves:
+        result = ("0-1" if gs.whiteToMove else "1-0") if gs.inCheck() else "1/2-1/2"
+    white = black = "Player"
+    if engineColor == "w":
+        white = "Engine"
+    elif engineColor == "b":
+        black = "Engine"
+    tags = {"Event": "Casual game", "Date": time.strftime("%Y.%m.%d"), "White": white, "Black": black}
+    with PGN.PGNWriter(gamesFile, "a") as writer:
+        writer.write(PGN.gameFromState(gs, tags, result))
 
 
-# draws the squares of the board. Top left is always light square.
-def drawBoard(screen, playerClicks):
-    colors = [p.Color("white"), p.Color("gray")]
+def enginesTurn(gs):
+    return engineColor is not None and (engineColor == "w") == gs.whiteToMove
+
+
+"""
+Responsible for graphics. Only squares that look different from what shown says is on screen are drawn, shown is
+updated to match. Returns the rects of the squares drawn, for display.update
+"""
+def drawGameState(screen, boardSurface, gs, playerClicks, shown):
+    selected = playerClicks[0] if len(playerClicks) == 1 else None
+    dirty = []
     for row in range(dimension):
         for col in range(dimension):
-            color = colors[((row + col) % 2)]
-            p.draw.rect(screen, color, p.Rect(col * squareSize, row * squareSize, squareSize, squareSize))
-
-    if len(playerClicks) == 1:
-        selectedSquare = playerClicks[0]
-        color = colors[((selectedSquare[0] + selectedSquare[1]) % 2)]
-        color = color.lerp(p.Color('red'), .1)
-        p.draw.rect(screen, color, p.Rect(selectedSquare[1] * squareSize, selectedSquare[0] * squareSize, squareSize, squareSize))
+            look = (gs.board[row][col], (row, col) == selected)
+            if shown.get((row, col)) != look:
+                shown[(row, col)] = look
+                dirty.append(drawSquare(screen, boardSurface, row, col, *look))
+    return dirty
 
 
-def drawPieces(screen, board):
+"""
+Draws the empty board once. Top left is always light square.
+"""
+def renderBoard():
+    surface = p.Surface((width, height))
+    colors = [p.Color("white"), p.Color("gray")]
     for row in range(dimension):
         for col in range(dimension):
-            piece = board[row][col]
-            if piece != "--":
-                screen.blit(IMAGES[piece], (col*squareSize, row*squareSize))
+            p.draw.rect(surface, colors[((row + col) % 2)], squareRect(row, col))
+    return surface
+
+
+def squareRect(row, col):
+    return p.Rect(col * squareSize, row * squareSize, squareSize, squareSize)
+
+
+# draws one square from the cached board, tinted when selected, and the piece on it
+def drawSquare(screen, boardSurface, row, col, piece, selected):
+    rect = squareRect(row, col)
+    screen.blit(boardSurface, rect, rect)
+    if selected:
+        color = boardSurface.get_at(rect.topleft).lerp(p.Color('red'), .1)
+        p.draw.rect(screen, color, rect)
+    if piece != "--":
+        screen.blit(IMAGES[piece], rect)
+    return rect
 
 
 if __name__ == "__main__":